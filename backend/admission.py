@@ -0,0 +1,227 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+
+from pdf_utils import page_count
+from metrics import ADMISSION_QUEUED, ADMISSION_IN_USE, ADMISSION_WAIT_SECONDS
+
+# Total estimated cost of uploads processed at once; one small PDF costs about 1
+ADMISSION_CAPACITY = float(os.getenv("ADMISSION_CAPACITY", "8"))
+# Uploads allowed to wait for capacity before new ones are turned away
+ADMISSION_MAX_WAITERS = int(os.getenv("ADMISSION_MAX_WAITERS", "16"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+# Each of these adds one unit to an upload's estimated cost
+ADMISSION_PAGES_PER_UNIT = int(os.getenv("ADMISSION_PAGES_PER_UNIT", "50"))
+ADMISSION_BYTES_PER_UNIT = int(os.getenv("ADMISSION_BYTES_PER_UNIT", str(10 * 1024 * 1024)))
+# Share of capacity a multi-file batch is charged at most
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))
+
+# Weight of the newest hold time in the running average behind Retry-After
+_HOLD_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """No capacity within the wait budget; retry_after is a hint in whole seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Upload capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_cost(path: str, capacity: float = ADMISSION_CAPACITY) -> float:
+    """Relative cost of processing a spooled PDF, from its size and page count.
+
+    Capped at capacity so even the largest document can run, alone. A file
+    fitz cannot open is costed by size; the job itself will report the error.
+    """
+    try:
+        pages = page_count(path)
+    except Exception:
+        pages = 0
+    cost = 1 + pages / ADMISSION_PAGES_PER_UNIT + os.path.getsize(path) / ADMISSION_BYTES_PER_UNIT
+    return min(cost, capacity)
+
+
+def estimate_batch_cost(paths: list, capacity: float = ADMISSION_CAPACITY) -> float:
+    """Cost of a batch of spooled PDFs: the sum of theirs, capped at ADMISSION_BATCH_SHARE of capacity.
+
+    The batch pipeline only has a few documents in flight whatever the batch
+    size, so charging the full sum would make a large batch wait for an idle
+    controller while it blocks the queue. It never costs less than its
+    largest document would alone.
+    """
+    costs = [estimate_cost(path, capacity) for path in paths]
+    if not costs:
+        return 0.0
+    return max(min(sum(costs), capacity * ADMISSION_BATCH_SHARE), max(costs))
+
+
+class _Waiter:
+    def __init__(self, cost: float, loop: asyncio.AbstractEventLoop):
+        self.cost = cost
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.granted = False
+
+
+class Permit:
+    """Capacity held by one admitted upload until release()"""
+
+    def __init__(self, controller, cost: float):
+        self.controller = controller
+        self.cost = cost
+        self.acquired_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(self)
+
+    def bind(self, fn):
+        """Wrap fn so the permit is released when it returns or raises"""
+        def run(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.release()
+        return run
+
+
+class AdmissionController:
+    """Weighted, bounded admission for expensive work, with a FIFO wait queue.
+
+    Admitted work holds its estimated cost until its permit is released,
+    which may happen on any thread. While capacity is short, callers wait in
+    arrival order, up to max_waiters of them for at most max_wait seconds;
+    beyond that they get Overloaded instead of piling up unbounded work.
+    """
+
+    def __init__(self, capacity: float = ADMISSION_CAPACITY, max_waiters: int = ADMISSION_MAX_WAITERS,
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.capacity = capacity
+        self.max_waiters = max_waiters
+        self.max_wait = max_wait
+        self.in_use = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_wait_seen = 0.0
+        self._waiters = deque()
+        self._hold_seconds = None
+        self._lock = threading.Lock()
+        ADMISSION_QUEUED.set(0)
+        ADMISSION_IN_USE.set(0)
+
+    def _fits(self, cost: float) -> bool:
+        return self.in_use + cost <= self.capacity
+
+    def _retry_after(self, cost: float) -> int:
+        """Seconds until roughly enough capacity frees up for cost more work"""
+        hold = self._hold_seconds or self.max_wait
+        backlog = sum(waiter.cost for waiter in self._waiters) + cost
+        return max(1, math.ceil(hold * backlog / self.capacity))
+
+    def _record_wait(self, outcome: str, waited: float):
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        ADMISSION_WAIT_SECONDS.observe(waited, outcome=outcome)
+
+    def _take(self, cost: float):
+        self.in_use += cost
+        self.admitted += 1
+        ADMISSION_IN_USE.set(self.in_use)
+
+    async def acquire(self, cost: float = 1.0) -> Permit:
+        """Wait for capacity for cost; raises Overloaded when the queue is full or the wait runs out"""
+        cost = min(max(cost, 0.0), self.capacity)
+        start = time.monotonic()
+        with self._lock:
+            # Arrivals never overtake waiters, so large uploads are not starved
+            if not self._waiters and self._fits(cost):
+                self._take(cost)
+                self._record_wait("admitted", 0.0)
+                return Permit(self, cost)
+            if len(self._waiters) >= self.max_waiters:
+                self.rejected += 1
+                self._record_wait("rejected", 0.0)
+                raise Overloaded("queue full", self._retry_after(cost))
+            waiter = _Waiter(cost, asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            ADMISSION_QUEUED.set(len(self._waiters))
+
+        try:
+            await asyncio.wait_for(waiter.event.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        with self._lock:
+            waited = time.monotonic() - start
+            if waiter.granted:
+                # Granted by a release that raced the timeout; the capacity is already ours
+                self._record_wait("admitted", waited)
+                return Permit(self, cost)
+            self._waiters.remove(waiter)
+            ADMISSION_QUEUED.set(len(self._waiters))
+            self.timed_out += 1
+            self._record_wait("timeout", waited)
+            retry_after = self._retry_after(cost)
+            # A departing head of the queue may unblock smaller waiters behind it
+            self._grant_waiters()
+        raise Overloaded("wait timed out", retry_after)
+
+    def _abandon(self, waiter: _Waiter):
+        """Drop a cancelled waiter, handing back capacity it was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                self.in_use = max(0.0, self.in_use - waiter.cost)
+                ADMISSION_IN_USE.set(self.in_use)
+            else:
+                self._waiters.remove(waiter)
+            self._grant_waiters()
+
+    def _grant_waiters(self):
+        while self._waiters and self._fits(self._waiters[0].cost):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._take(waiter.cost)
+            waiter.loop.call_soon_threadsafe(waiter.event.set)
+        ADMISSION_QUEUED.set(len(self._waiters))
+
+    def _release(self, permit: Permit):
+        held = time.monotonic() - permit.acquired_at
+        with self._lock:
+            self.in_use = max(0.0, self.in_use - permit.cost)
+            ADMISSION_IN_USE.set(self.in_use)
+            if self._hold_seconds is None:
+                self._hold_seconds = held
+            else:
+                self._hold_seconds += _HOLD_SMOOTHING * (held - self._hold_seconds)
+            self._grant_waiters()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_use": round(self.in_use, 3),
+                "queued": len(self._waiters),
+                "queued_cost": round(sum(waiter.cost for waiter in self._waiters), 3),
+                "max_waiters": self.max_waiters,
+                "max_wait_seconds": self.max_wait,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "max_wait_seen_seconds": round(self.max_wait_seen, 3),
+                "avg_hold_seconds": round(self._hold_seconds, 3) if self._hold_seconds is not None else None,
+            }
+
+
+upload_admission = AdmissionController()
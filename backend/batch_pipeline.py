@@ -0,0 +1,195 @@
+import os
+import copy
+import time
+import queue
+import logging
+import threading
+
+from ingest import discard_upload
+from pdf_utils import extract_pages, page_fingerprint
+from hf_client import embed_texts, BATCH_GENERATE_WORKERS
+from generation_cache import generation_cache, generation_key, MISS
+from db import get_manifest
+from metrics import STAGE_SECONDS
+from pipeline import (INCREMENTAL, generation_model, cacheable, chunk_pages, generate_cards, card_texts,
+                      diff_pages, change_budget, store_documents)
+
+log = logging.getLogger(__name__)
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+# Most documents folded into one embedding request or one storage write
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "8"))
+# How long a batching stage waits after its first document for others to catch up
+BATCH_LINGER_SECONDS = float(os.getenv("BATCH_LINGER_SECONDS", "0.05"))
+
+BATCH_STAGES = ["batch"]
+
+# Closes a stage's inbox
+_DONE = object()
+
+
+def _take(inbox: queue.Queue, limit: int, linger: float = 0.0):
+    """Block for one document, then collect up to limit for linger more seconds; None once closed"""
+    first = inbox.get()
+    if first is _DONE:
+        inbox.put(_DONE)
+        return None
+    docs = [first]
+    deadline = time.monotonic() + linger
+    while len(docs) < limit:
+        try:
+            doc = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if doc is _DONE:
+            inbox.put(_DONE)
+            break
+        docs.append(doc)
+    return docs
+
+
+def _start_stage(name: str, fn, inbox: queue.Queue, outbox: queue.Queue, workers: int = 1, batch: int = 1):
+    """Run fn on worker threads over documents from inbox, passing each on to outbox.
+
+    fn gets a list of up to batch documents that are ready together;
+    documents that failed in an earlier stage skip it. The last worker to
+    see the inbox closed closes the outbox.
+    """
+    workers = max(1, workers)
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            docs = _take(inbox, batch, BATCH_LINGER_SECONDS if batch > 1 else 0.0)
+            if docs is None:
+                break
+            live = [doc for doc in docs if "error" not in doc]
+            if live:
+                start = time.perf_counter()
+                try:
+                    fn(live)
+                except Exception as e:
+                    log.exception("Batch stage failed", extra={"stage": name, "files": [d["filename"] for d in live]})
+                    for doc in live:
+                        doc["error"] = str(e)
+                        # Uploads waiting on this document's generation get the error too
+                        if doc.pop("claimed", False):
+                            generation_cache.abandon(doc["key"], e)
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+            for doc in docs:
+                outbox.put(doc)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            outbox.put(_DONE)
+
+    for i in range(workers):
+        threading.Thread(target=work, name=f"batch-{name}-{i}", daemon=True).start()
+
+
+def process_pdf_batch(job, uploads: list, user_id: str, n_cards: int = 5):
+    """Ingest several spooled PDFs as one pipeline; uploads are (path, filename, digest).
+
+    Stages run concurrently on separate threads, so one document is being
+    extracted while another generates and a third is embedded. Documents
+    that reach embedding or persistence together share one embedding
+    request and one storage write. Repeat uploads are served from the
+    generation cache, concurrent uploads of the same content share one
+    generation, and edited documents are re-ingested incrementally, as
+    with single uploads. A failing document does not stop the others.
+    """
+    docs = [{"filename": filename, "path": path, "digest": digest} for path, filename, digest in uploads]
+    job.start_stage("batch")
+    job.set_items(0, len(docs))
+
+    def extract(batch):
+        doc = batch[0]
+        try:
+            document = doc["filename"]
+            manifest = get_manifest(user_id, document) if document else None
+            diff = diff_pages(doc["path"], manifest) if manifest else None
+            # A different PDF that only shares the name is ingested as new, and
+            # the manifest keeps tracking the earlier document's cards
+            doc["manifest"] = manifest if diff is not None else None
+            doc["track"] = diff is not None or not (manifest or {}).get("cards")
+            if diff is not None:
+                changed = diff.pop("changed")
+                doc["cache"] = INCREMENTAL
+                doc["generated"] = {"flashcards": [], "embeddings": [], "embedding_models": [], "card_pages": [],
+                                    "changed_pages": [page_no for page_no, _ in changed], **diff}
+                if changed:
+                    doc["budget"] = change_budget(n_cards, len(changed), len(diff["fingerprints"]))
+                    doc["page_chunks"] = chunk_pages(changed)
+                return
+
+            if doc["digest"]:
+                doc["key"] = generation_key(doc["digest"], n_cards, generation_model())
+                cached, doc["cache"] = generation_cache.claim(doc["key"])
+                if doc["cache"] != MISS:
+                    doc["generated"] = cached
+                    return
+                doc["claimed"] = True
+            pages = list(enumerate(extract_pages(doc["path"])))
+            doc["cache"] = MISS
+            doc["generated"] = {"fingerprints": [page_fingerprint(text) for _, text in pages]}
+            doc["budget"] = n_cards
+            doc["page_chunks"] = chunk_pages(pages)
+        finally:
+            discard_upload(doc["path"])
+
+    def generate(batch):
+        doc = batch[0]
+        if "page_chunks" in doc:
+            doc["generated"].update(generate_cards(doc.pop("page_chunks"), doc["budget"]))
+            doc["embed"] = True
+
+    def embed(batch):
+        # Cache hits and unchanged re-uploads arrive with their embeddings already
+        pending = [doc for doc in batch if doc.pop("embed", False)]
+        texts = [card_texts(doc["generated"]["flashcards"]) for doc in pending]
+        vectors, models = embed_texts([text for group in texts for text in group]) if pending else ([], [])
+        start = 0
+        for doc, group in zip(pending, texts):
+            doc["generated"]["embeddings"] = vectors[start:start + len(group)]
+            doc["generated"]["embedding_models"] = models[start:start + len(group)]
+            start += len(group)
+            if doc.pop("claimed", False):
+                # A copy, as persisting tags the cards with their document
+                generation_cache.resolve(doc["key"], copy.deepcopy(doc["generated"]), cacheable(doc["generated"]))
+
+    def persist(batch):
+        results = store_documents(user_id, [
+            {"document": doc["filename"], "manifest": doc["manifest"], "generated": doc["generated"],
+             "cache": doc["cache"], "track": doc["track"]}
+            for doc in batch
+        ])
+        for doc, result in zip(batch, results):
+            doc["result"] = result
+
+    queues = [queue.Queue() for _ in range(5)]
+    _start_stage("extract", extract, queues[0], queues[1])
+    _start_stage("generate", generate, queues[1], queues[2], workers=BATCH_GENERATE_WORKERS)
+    _start_stage("embed", embed, queues[2], queues[3], batch=BATCH_MAX_DOCUMENTS)
+    _start_stage("persist", persist, queues[3], queues[4], batch=BATCH_MAX_DOCUMENTS)
+    for doc in docs:
+        queues[0].put(doc)
+    queues[0].put(_DONE)
+
+    done = 0
+    while queues[4].get() is not _DONE:
+        done += 1
+        job.set_items(done, len(docs))
+
+    files = []
+    for doc in docs:
+        if "error" in doc:
+            files.append({"filename": doc["filename"], "status": "failed", "error": doc["error"]})
+        else:
+            files.append({"filename": doc["filename"], "status": "completed", **doc["result"]})
+    return {
+        "files": files,
+        "stored": sum(entry.get("stored", 0) for entry in files),
+        "failed_files": sum(1 for entry in files if entry["status"] == "failed"),
+    }
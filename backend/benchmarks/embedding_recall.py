@@ -0,0 +1,89 @@
+"""Measure top-k recall, memory and payload size of quantized embeddings against float32.
+
+Run from the backend directory:
+    python -m benchmarks.embedding_recall --cards 20000 --dims 384 768
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+
+from embedding_codec import decode, to_storage
+from fakes import synthetic_text
+from local_embeddings import LocalEmbedder
+from vector_index import _Matrix
+
+KINDS = ["float32", "float16", "int8"]
+
+
+def local_vectors(n: int, rng: random.Random) -> np.ndarray:
+    texts = [synthetic_text(rng, 2) for _ in range(n)]
+    return LocalEmbedder().embed(texts)
+
+
+def clustered_vectors(n: int, dim: int, rng: random.Random) -> np.ndarray:
+    """Dense vectors around topic centroids, shaped like transformer sentence embeddings"""
+    gen = np.random.default_rng(rng.randrange(2 ** 32))
+    centroids = gen.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    vectors = centroids[gen.integers(0, len(centroids), n)] + 0.6 * gen.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(vectors: np.ndarray, kind: str) -> _Matrix:
+    matrix = _Matrix(vectors.shape[1], kind)
+    for i, vec in enumerate(vectors):
+        matrix.set(i, vec)
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dims", type=int, nargs="+", default=[384, 768],
+                        help="384 uses the local n-gram embedder; other sizes use clustered random vectors")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for dim in args.dims:
+        vectors = local_vectors(args.cards + args.queries, rng) if dim == 384 else \
+            clustered_vectors(args.cards + args.queries, dim, rng)
+        cards, queries = vectors[:args.cards], vectors[args.cards:]
+        exact = build(cards, "float32")
+        truth = [{card_id for card_id, _ in exact.search(q, args.k, False)} for q in queries]
+
+        # A Python list of floats, as embeddings were passed around before
+        list_bytes = 56 + 8 * dim + 24 * dim
+        json_bytes = statistics.mean(len(json.dumps(vec.tolist())) for vec in cards[:500])
+        print(f"\n{dim} dims, {args.cards} cards, top-{args.k}; python list ~{list_bytes} B/card, "
+              f"JSON payload {json_bytes:.0f} B/card")
+        print(f"{'format':>8} {'recall':>7} {'mem_B/card':>11} {'mem_x':>6} {'payload_B':>10} "
+              f"{'payload_x':>10} {'decode_us':>10} {'search_ms':>10}")
+        for kind in KINDS:
+            matrix = build(cards, kind)
+            hits = [{card_id for card_id, _ in matrix.search(q, args.k, False)} for q in queries]
+            recall = statistics.mean(len(h & t) / len(t) for h, t in zip(hits, truth))
+
+            stored = [to_storage(vec, kind) for vec in cards[:500]]
+            payload = statistics.mean(len(value) for value in stored)
+            start = time.perf_counter()
+            for value in stored:
+                decode(value)
+            decode_us = (time.perf_counter() - start) / len(stored) * 1e6
+
+            start = time.perf_counter()
+            for q in queries:
+                matrix.search(q, args.k, False)
+            search_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+            per_card = matrix.nbytes / len(matrix)
+            print(f"{kind:>8} {recall:>7.3f} {per_card:>11.0f} {list_bytes / per_card:>6.1f} {payload:>10.0f} "
+                  f"{json_bytes / payload:>10.1f} {decode_us:>10.1f} {search_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
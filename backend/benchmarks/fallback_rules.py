@@ -0,0 +1,262 @@
+"""Check the single-pass fallback engine against the original rule loop and time both.
+
+The original implementation is kept here verbatim as the reference: every
+golden text must produce identical cards for every n_cards.
+
+Run from the backend directory:
+    python -m benchmarks.fallback_rules --sizes 1 4 16
+"""
+import argparse
+import random
+import time
+
+from fallback_rules import generate_flashcards_fallback
+
+
+# Reference copy of hf_client.generate_flashcards_fallback before the rewrite
+def legacy_generate_flashcards_fallback(text: str, n_cards: int = 5):
+    """Generate high-quality flashcards from text using advanced text processing"""
+    import re
+    
+    # Clean and normalize text
+    text = re.sub(r'\s+', ' ', text.strip())
+    text = re.sub(r'[^\w\s.,!?;:()\-]', '', text)  # Remove special chars except basic punctuation
+    
+    flashcards = []
+    
+    # 1. Extract definitions and explanations
+    definition_patterns = [
+        # "X is Y" patterns
+        (r'([A-Z][a-zA-Z\s]{2,30})\s+is\s+([^.!?]{10,80})[.!?]', "What is {}?"),
+        (r'([A-Z][a-zA-Z\s]{2,30})\s+means\s+([^.!?]{10,80})[.!?]', "What does {} mean?"),
+        (r'([A-Z][a-zA-Z\s]{2,30})\s+refers to\s+([^.!?]{10,80})[.!?]', "What does {} refer to?"),
+        
+        # "A X is Y" patterns  
+        (r'A\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is a {}?"),
+        (r'An\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is an {}?"),
+        (r'The\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is the {}?"),
+        
+        # "X can be defined as Y" patterns
+        (r'([A-Z][a-zA-Z\s]{2,30})\s+can be defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
+        (r'([A-Z][a-zA-Z\s]{2,30})\s+is defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
+    ]
+    
+    for pattern, question_template in definition_patterns:
+        matches = re.finditer(pattern, text, re.IGNORECASE)
+        for match in matches:
+            if len(flashcards) >= n_cards:
+                break
+                
+            term = match.group(1).strip()
+            definition = match.group(2).strip()
+            
+            # Clean up term and definition
+            term = re.sub(r'\s+', ' ', term)
+            definition = re.sub(r'\s+', ' ', definition)
+            
+            # Skip if too short or too long
+            if len(term) < 3 or len(term) > 40 or len(definition) < 8 or len(definition) > 100:
+                continue
+                
+            # Skip if definition contains question words (likely not a definition)
+            if any(word in definition.lower() for word in ['what', 'how', 'why', 'when', 'where', 'which']):
+                continue
+                
+            question = question_template.format(term.lower())
+            
+            flashcards.append({
+                "question": question,
+                "answer": definition,
+                "difficulty": "medium"
+            })
+    
+    # 2. Extract key facts and relationships
+    if len(flashcards) < n_cards:
+        fact_patterns = [
+            # "X has Y" patterns
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+has\s+([^.!?]{5,60})[.!?]', "What does {} have?"),
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+contains\s+([^.!?]{5,60})[.!?]', "What does {} contain?"),
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+includes\s+([^.!?]{5,60})[.!?]', "What does {} include?"),
+            
+            # "X does Y" patterns
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+performs\s+([^.!?]{5,60})[.!?]', "What does {} perform?"),
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+provides\s+([^.!?]{5,60})[.!?]', "What does {} provide?"),
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+ensures\s+([^.!?]{5,60})[.!?]', "What does {} ensure?"),
+            
+            # "X are Y" patterns
+            (r'([A-Z][a-zA-Z\s]{2,30})\s+are\s+([^.!?]{5,60})[.!?]', "What are {}?"),
+        ]
+        
+        for pattern, question_template in fact_patterns:
+            matches = re.finditer(pattern, text, re.IGNORECASE)
+            for match in matches:
+                if len(flashcards) >= n_cards:
+                    break
+                    
+                subject = match.group(1).strip()
+                fact = match.group(2).strip()
+                
+                # Clean up
+                subject = re.sub(r'\s+', ' ', subject)
+                fact = re.sub(r'\s+', ' ', fact)
+                
+                if len(subject) < 3 or len(subject) > 40 or len(fact) < 5 or len(fact) > 80:
+                    continue
+                    
+                question = question_template.format(subject.lower())
+                
+                flashcards.append({
+                    "question": question,
+                    "answer": fact,
+                    "difficulty": "medium"
+                })
+    
+    # 3. Extract numbered lists and steps
+    if len(flashcards) < n_cards:
+        # Look for numbered items
+        numbered_items = re.findall(r'(\d+)[.)]\s*([^.!?]{10,100})[.!?]', text)
+        
+        for i, (num, item) in enumerate(numbered_items[:n_cards - len(flashcards)]):
+            if len(item.strip()) < 10:
+                continue
+                
+            question = f"What is step {num} or point {num}?"
+            answer = item.strip()
+            
+            flashcards.append({
+                "question": question,
+                "answer": answer,
+                "difficulty": "medium"
+            })
+    
+    # 4. Create comparison questions
+    if len(flashcards) < n_cards:
+        # Look for comparison words
+        comparison_sentences = re.findall(r'([^.!?]*(?:different|similar|compare|contrast|versus|vs)[^.!?]*)[.!?]', text, re.IGNORECASE)
+        
+        for sentence in comparison_sentences[:n_cards - len(flashcards)]:
+            sentence = sentence.strip()
+            if len(sentence) < 20 or len(sentence) > 120:
+                continue
+                
+            question = "What is the comparison or difference mentioned?"
+            answer = sentence
+            
+            flashcards.append({
+                "question": question,
+                "answer": answer,
+                "difficulty": "medium"
+            })
+    
+    # 5. Fallback: Create questions from important sentences
+    if len(flashcards) < n_cards:
+        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if len(s.strip()) > 20]
+        
+        # Filter for sentences with important keywords
+        important_sentences = []
+        keywords = ['important', 'key', 'main', 'primary', 'essential', 'significant', 
+                   'must', 'should', 'required', 'necessary', 'critical', 'fundamental']
+        
+        for sentence in sentences:
+            if any(keyword in sentence.lower() for keyword in keywords):
+                important_sentences.append(sentence)
+        
+        for sentence in important_sentences[:n_cards - len(flashcards)]:
+            if len(sentence) > 150:
+                sentence = sentence[:150] + "..."
+                
+            question = "What important point is mentioned?"
+            answer = sentence
+            
+            flashcards.append({
+                "question": question,
+                "answer": answer,
+                "difficulty": "medium"
+            })
+    
+    return flashcards[:n_cards]
+
+
+SUBJECTS = ["Photosynthesis", "The mitochondria", "A neuron", "An enzyme", "Osmosis", "The cell membrane",
+            "Entropy", "Inflation", "A compiler", "The kernel", "Gravity", "Mitosis"]
+VERBS = ["is", "means", "refers to", "can be defined as", "is defined as", "has", "contains", "includes",
+         "performs", "provides", "ensures", "are"]
+FILLER = ("the process by which energy from light is captured and stored for later use in the system "
+          "while several other factors play a role").split()
+KEYWORDS = ["important", "key", "main", "essential", "critical", "necessary", "significant"]
+
+
+def make_sentence(rng: random.Random) -> str:
+    kind = rng.random()
+    body = " ".join(rng.choices(FILLER, k=rng.randint(2, 16)))
+    if kind < 0.45:
+        return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {body}{rng.choice('..!?')}"
+    if kind < 0.55:
+        return f"{rng.randint(1, 12)}{rng.choice('.)')} {body}."
+    if kind < 0.65:
+        return f"Mitosis is {rng.choice(['different from', 'similar to', 'versus'])} meiosis in {body}."
+    if kind < 0.75:
+        return f"It is {rng.choice(KEYWORDS)} that {body}..."
+    if kind < 0.8:
+        return f"What {body}? Why {body}?"
+    if kind < 0.85:
+        return f"  {body} \u2014 {body} (see [1]) & more\n\n"
+    return body.capitalize() + "."
+
+
+def golden_corpus(rng: random.Random, n_texts: int = 300) -> list:
+    texts = ["", "   ", "No terminator at all", "Photosynthesis is how plants turn light into sugar"]
+    for _ in range(n_texts):
+        texts.append(" ".join(make_sentence(rng) for _ in range(rng.randint(1, 40))))
+    return texts
+
+
+def check(texts: list, n_values: list) -> int:
+    compared = 0
+    for text in texts:
+        for n in n_values:
+            expected = legacy_generate_flashcards_fallback(text, n)
+            actual = generate_flashcards_fallback(text, n)
+            if actual != expected:
+                raise AssertionError(f"Mismatch for n_cards={n} on text {text[:80]!r}:\n"
+                                     f"  legacy: {expected}\n  engine: {actual}")
+            compared += 1
+    return compared
+
+
+def timed(fn, text: str, n: int) -> float:
+    start = time.perf_counter()
+    fn(text, n)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="text sizes in MB")
+    parser.add_argument("--n-cards", type=int, nargs="+", default=[1, 3, 5, 10, 50])
+    parser.add_argument("--sparse", action="store_true",
+                        help="time text with few definitions, so no rule fills the deck early")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"golden corpus: {check(golden_corpus(rng), args.n_cards)} comparisons identical")
+
+    print(f"{'size_mb':>8} {'n_cards':>8} {'legacy_s':>9} {'engine_s':>9} {'speedup':>8}")
+    for size in args.sizes:
+        sentences, length = [], 0
+        while length < size * 1024 * 1024:
+            sentence = make_sentence(rng)
+            if args.sparse and " is " in sentence:
+                continue
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        text = " ".join(sentences)
+        for n in (5, 50):
+            assert generate_flashcards_fallback(text, n) == legacy_generate_flashcards_fallback(text, n)
+            legacy = timed(legacy_generate_flashcards_fallback, text, n)
+            engine = timed(generate_flashcards_fallback, text, n)
+            print(f"{size:>8g} {n:>8} {legacy:>9.3f} {engine:>9.3f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
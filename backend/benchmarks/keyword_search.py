@@ -0,0 +1,119 @@
+"""Compare pruned BM25 search with exhaustive BM25 scoring and the old linear substring scan.
+
+Run from the backend directory:
+    python -m benchmarks.keyword_search --sizes 10000 100000 1000000
+
+Pruned results are checked against exhaustive scoring. The growth columns
+give log(latency ratio) / log(deck size ratio) against the smallest size:
+1.0 is linear in the deck, below 1.0 sublinear.
+"""
+import argparse
+import heapq
+import math
+import random
+import statistics
+import time
+
+from keyword_index import BM25_B, BM25_K1, _UserIndex, tokenize
+
+VOCAB_SIZE = 20000
+
+
+def make_vocab(rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(VOCAB_SIZE)]
+
+
+def make_cards(n: int, vocab: list, rng: random.Random):
+    # Zipf-like word frequencies so a few terms are common and most are rare
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    for i in range(n):
+        words = rng.choices(vocab, weights=weights, k=18)
+        yield {
+            "id": i,
+            "question": "What is " + " ".join(words[:6]) + "?",
+            "answer": " ".join(words[6:]),
+            "difficulty": "medium",
+        }
+
+
+# Reference copy of _UserIndex.search before pruning: scores every posting of every term
+def exhaustive_search(index: _UserIndex, query: str, k: int, prefix: bool):
+    n_docs = len(index.doc_len)
+    avg_len = index.total_len / n_docs or 1.0
+    scores = {}
+    for query_term in set(tokenize(query)):
+        for term in index.expand(query_term, prefix):
+            posting = index.postings[term]
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            weight = idf if term == query_term else idf * 0.5
+            for card_id, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * index.doc_len[card_id] / avg_len)
+                scores[card_id] = scores.get(card_id, 0.0) + weight * tf * (BM25_K1 + 1) / (tf + norm)
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def linear_scan(cards: list, query: str, k: int):
+    query = query.lower()
+    return [card for card in cards
+            if query in card["question"].lower() or query in card["answer"].lower()][:k]
+
+
+def percentile(samples: list, pct: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def timed(fn, queries: list) -> list:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=20, help="linear scan is slow; sample fewer")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocab = make_vocab(rng)
+    # Queries mix common, mid-frequency and rare terms, plus prefixes
+    queries = [rng.choice(vocab[:200]) + " " + rng.choice(vocab[1000:]) for _ in range(args.queries)]
+    queries += [rng.choice(vocab[100:5000])[:3] for _ in range(args.queries // 4)]
+
+    print(f"{'cards':>9} {'build_s':>8} {'bm25_p50_ms':>12} {'bm25_p95_ms':>12} {'exh_p50_ms':>11} "
+          f"{'scan_p50_ms':>12} {'bm25_growth':>12} {'exh_growth':>11}")
+    first = None
+    for n in args.sizes:
+        cards = list(make_cards(n, vocab, rng))
+        index = _UserIndex()
+        start = time.perf_counter()
+        for card in cards:
+            index.add(card)
+        build = time.perf_counter() - start
+
+        for query in queries:
+            pruned = [score for _, score in index.search(query, 10, True)]
+            exhaustive = [score for _, score in exhaustive_search(index, query, 10, True)]
+            assert all(math.isclose(a, b) for a, b in zip(pruned, exhaustive)) and len(pruned) == len(exhaustive), query
+
+        bm25_samples = timed(lambda q: index.search(q, 10, True), queries)
+        bm25 = statistics.median(bm25_samples)
+        exh = statistics.median(timed(lambda q: exhaustive_search(index, q, 10, True), queries))
+        scan = timed(lambda q: linear_scan(cards, q, 10), queries[:args.scan_queries])
+        growth = ["", ""]
+        if first:
+            size_ratio = math.log(n / first[0])
+            growth = [f"{math.log(bm25 / first[1]) / size_ratio:.2f}", f"{math.log(exh / first[2]) / size_ratio:.2f}"]
+        print(f"{n:>9} {build:>8.2f} {bm25:>12.3f} "
+              f"{percentile(bm25_samples, 0.95):>12.3f} {exh:>11.3f} "
+              f"{statistics.median(scan):>12.3f} {growth[0]:>12} {growth[1]:>11}")
+        first = first or (n, bm25, exh)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure local n-gram embedding throughput and how well it ranks paraphrases.
+
+Run from the backend directory:
+    python -m benchmarks.local_embeddings --texts 10000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from local_embeddings import LocalEmbedder
+
+TOPICS = [
+    ("What is photosynthesis?", "the process plants use to turn light into chemical energy",
+     "How do plants convert sunlight into chemical energy?"),
+    ("What is the mitochondria?", "the organelle that produces ATP for the cell",
+     "Which organelle generates ATP in cells?"),
+    ("What does osmosis mean?", "movement of water across a semipermeable membrane",
+     "How does water move through a semi-permeable membrane?"),
+    ("What is inflation?", "a general rise in prices that reduces purchasing power",
+     "Why do rising prices reduce purchasing power?"),
+    ("What is a compiler?", "a program that translates source code into machine code",
+     "What translates source code to machine code?"),
+    ("What does entropy refer to?", "the measure of disorder in a thermodynamic system",
+     "How is disorder in a thermodynamic system measured?"),
+    ("What is mitosis?", "cell division producing two identical daughter cells",
+     "What kind of cell division gives identical daughter cells?"),
+    ("What does the kernel provide?", "scheduling, memory management and device drivers",
+     "Which part of the operating system manages memory and scheduling?"),
+]
+FILLER = ("system process energy cell data value model structure function element result method "
+          "network layer signal pattern theory market policy").split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    embedder = LocalEmbedder()
+    texts = [f"What is {' '.join(rng.choices(FILLER, k=3))}? {' '.join(rng.choices(FILLER, k=20))}"
+             for _ in range(args.texts)]
+
+    start = time.perf_counter()
+    for i in range(0, len(texts), args.batch):
+        embedder.embed(texts[i:i + args.batch])
+    elapsed = time.perf_counter() - start
+    print(f"throughput: {len(texts) / elapsed:.0f} embeddings/s ({args.texts} texts, batch {args.batch})")
+
+    # Each paraphrased query should rank its own card first among distractor cards
+    cards = embedder.embed([f"{q} {a}" for q, a, _ in TOPICS] + texts[:1000])
+    queries = embedder.embed([query for _, _, query in TOPICS])
+    top = np.argmax(queries @ cards.T, axis=1)
+    hits = int(np.sum(top == np.arange(len(TOPICS))))
+    print(f"paraphrase top-1: {hits}/{len(TOPICS)} against {len(cards)} cards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compare serial and parallel PDF text extraction.
+
+Run from the backend directory:
+    python -m benchmarks.pdf_extract --pages 50 150 400
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz
+
+import pdf_utils
+
+PARAGRAPH = (
+    "Photosynthesis is the process by which green plants convert light energy "
+    "into chemical energy. The mitochondria is the powerhouse of the cell and "
+    "provides ATP for metabolic reactions. "
+)
+
+
+def make_pdf(path: str, n_pages: int):
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        box = fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36)
+        page.insert_textbox(box, f"Page {i + 1}. " + PARAGRAPH * 12, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 150, 400])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Warm the pool so process start-up is not charged to the first run
+    with tempfile.TemporaryDirectory() as tmpdir:
+        warm = os.path.join(tmpdir, "warm.pdf")
+        make_pdf(warm, 2)
+        pdf_utils.extract_text_from_pdf(warm, parallel=True)
+
+        print(f"{'pages':>6} {'serial_s':>9} {'parallel_s':>11} {'speedup':>8}")
+        for n_pages in args.pages:
+            path = os.path.join(tmpdir, f"doc-{n_pages}.pdf")
+            make_pdf(path, n_pages)
+            serial = pdf_utils.extract_text_from_pdf(path, parallel=False)
+            assert pdf_utils.extract_text_from_pdf(path, parallel=True) == serial
+            t_serial = timed(lambda: pdf_utils.extract_text_from_pdf(path, parallel=False), args.repeat)
+            t_parallel = timed(lambda: pdf_utils.extract_text_from_pdf(path, parallel=True), args.repeat)
+            print(f"{n_pages:>6} {t_serial:>9.3f} {t_parallel:>11.3f} {t_serial / t_parallel:>7.2f}x")
+
+    pdf_utils.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
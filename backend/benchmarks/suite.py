@@ -0,0 +1,297 @@
+"""End-to-end benchmark suite against in-process fakes of Supabase, Gemini and Hugging Face.
+
+Drives the FastAPI app through its HTTP endpoints with no network access
+and writes p50/p95/p99 latencies and throughput per scenario to a JSON file,
+so results can be compared across commits.
+
+Run from the backend directory:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --deck-sizes 1000 10000 100000 --uploads 16 --preset medium
+    python -m benchmarks.suite --scenarios batch --uploads 16 --preset medium
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import db
+import hf_client
+from dedupe import near_duplicates
+from deck_cache import deck_cache
+from fakes import FakeEmbeddingClient, FakeGemini, FakeSupabase, PDF_PRESETS, make_pdf, synthetic_text
+from keyword_index import keyword_index
+from local_embeddings import local_embedder
+from main import app
+from providers import registry
+from search import MODES
+from sqlite_store import SqliteBackend
+from storage import SupabaseBackend
+from vector_index import vector_index
+
+TERMINAL = ("completed", "failed")
+SEED_BATCH = 1000
+
+
+def percentile(samples: list, pct: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def summarize(samples_ms: list, elapsed: float, **extra) -> dict:
+    return {
+        "n": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 0.50), 3),
+        "p95_ms": round(percentile(samples_ms, 0.95), 3),
+        "p99_ms": round(percentile(samples_ms, 0.99), 3),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "throughput_per_s": round(len(samples_ms) / elapsed, 2) if elapsed > 0 else None,
+        **extra,
+    }
+
+
+def timed_requests(send, count: int):
+    """Call send(i) count times; returns (latencies in ms, total seconds)"""
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        began = time.perf_counter()
+        send(i)
+        samples.append((time.perf_counter() - began) * 1000)
+    return samples, time.perf_counter() - start
+
+
+def make_backend(args, tmpdir: str, name: str, latency: float = None):
+    """Storage for one scenario: a fake Supabase with injected latency, or a real SQLite file"""
+    if args.storage == "sqlite":
+        return SqliteBackend(os.path.join(tmpdir, f"{name}.db"))
+    latency = args.db_latency if latency is None else latency
+    return SupabaseBackend(FakeSupabase(latency, args.error_rate if latency else 0.0, latency / 2, args.seed))
+
+
+def install_fakes(args, tmpdir: str):
+    """Route every remote dependency to an in-process fake"""
+    db.set_backend(make_backend(args, tmpdir, "upload"))
+    registry.pin(
+        gemini_model=FakeGemini(args.gemini_latency, args.error_rate, args.gemini_latency / 2, args.seed),
+        embed_client=FakeEmbeddingClient(args.embed_latency, args.error_rate, args.embed_latency / 2, args.seed),
+    )
+    # The generation and embedding paths check for credentials before using the clients
+    hf_client.GEMINI_API_KEY = "fake"
+    hf_client.HF_TOKEN = "fake"
+
+
+def seed_deck(args, tmpdir: str, size: int, rng: random.Random):
+    """Fill a fresh store with size cards, bypassing the upload path"""
+    backend = make_backend(args, tmpdir, f"deck-{size}", latency=0.0)
+    db.set_backend(backend)
+    for cache in (deck_cache, keyword_index, vector_index, near_duplicates):
+        cache.invalidate()
+    for start in range(0, size, SEED_BATCH):
+        cards = [{"question": f"What about {synthetic_text(rng, 1)[:60]}?", "answer": synthetic_text(rng, 1),
+                  "difficulty": rng.choice(["easy", "medium", "hard"])}
+                 for _ in range(min(SEED_BATCH, size - start))]
+        vectors = local_embedder.embed([f"{c['question']} {c['answer']}" for c in cards]).tolist()
+        db.save_flashcards("anonymous_user", cards, vectors)
+    if isinstance(backend, SupabaseBackend):
+        # Latency is applied only once the deck exists, so seeding stays fast
+        fake = backend.client
+        fake.latency, fake.jitter, fake.error_rate = args.db_latency, args.db_latency / 2, args.error_rate
+
+
+def bench_upload(client: TestClient, args, tmpdir: str) -> dict:
+    documents = []
+    for i in range(args.uploads):
+        path = os.path.join(tmpdir, f"doc-{i}.pdf")
+        make_pdf(path, args.preset, seed=args.seed + i)
+        with open(path, "rb") as f:
+            documents.append((f"doc-{i}.pdf", f.read()))
+
+    throttled = 0
+
+    def submit(name: str, data: bytes) -> str:
+        # Back off as told while admission control is refusing uploads
+        nonlocal throttled
+        while True:
+            response = client.post("/upload-pdf/", files={"file": (name, data, "application/pdf")},
+                                   data={"n_cards": args.n_cards})
+            if response.status_code != 429:
+                return response.json()["job_id"]
+            throttled += 1
+            time.sleep(float(response.headers.get("Retry-After", "1")))
+
+    start = time.perf_counter()
+    job_ids = [submit(name, data) for name, data in documents]
+    jobs = {}
+    while len(jobs) < len(job_ids):
+        for job_id in job_ids:
+            if job_id not in jobs:
+                job = client.get(f"/jobs/{job_id}").json()
+                if job["status"] in TERMINAL:
+                    jobs[job_id] = job
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    samples = [(job["finished_at"] - job["created_at"]) * 1000 for job in jobs.values()]
+    pages = PDF_PRESETS[args.preset] if args.preset in PDF_PRESETS else int(args.preset)
+    failed = sum(1 for job in jobs.values() if job["status"] == "failed")
+    stored = sum((job.get("result") or {}).get("stored", 0) for job in jobs.values())
+    return summarize(samples, elapsed, pages_per_s=round(pages * len(jobs) / elapsed, 2),
+                     failed_jobs=failed, stored_cards=stored, throttled=throttled)
+
+
+def wait_for_job(client: TestClient, job_id: str) -> dict:
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in TERMINAL:
+            return job
+        time.sleep(0.01)
+
+
+def bench_batch(client: TestClient, args, tmpdir: str) -> dict:
+    """The same number of documents uploaded one after another, then as one batch"""
+    def documents(prefix: str, seed: int) -> list:
+        # Fresh content per run, so neither is served from the generation cache
+        docs = []
+        for i in range(args.uploads):
+            path = os.path.join(tmpdir, f"{prefix}-{i}.pdf")
+            make_pdf(path, args.preset, seed=seed + i)
+            with open(path, "rb") as f:
+                docs.append((f"{prefix}-{i}.pdf", f.read()))
+        return docs
+
+    serial_docs = documents("serial", args.seed + 10000)
+    start = time.perf_counter()
+    for name, data in serial_docs:
+        job_id = client.post("/upload-pdf/", files={"file": (name, data, "application/pdf")},
+                             data={"n_cards": args.n_cards}).json()["job_id"]
+        wait_for_job(client, job_id)
+    serial = time.perf_counter() - start
+
+    batch_docs = documents("batch", args.seed + 20000)
+    start = time.perf_counter()
+    response = client.post("/upload-pdfs/", files=[("files", (name, data, "application/pdf"))
+                                                   for name, data in batch_docs],
+                           data={"n_cards": args.n_cards})
+    job = wait_for_job(client, response.json()["job_id"])
+    batch = time.perf_counter() - start
+
+    result = job.get("result") or {}
+    return {
+        "files": len(batch_docs),
+        "serial_s": round(serial, 3),
+        "batch_s": round(batch, 3),
+        "speedup": round(serial / batch, 2) if batch > 0 else None,
+        "failed_files": result.get("failed_files", len(batch_docs)),
+        "stored_cards": result.get("stored", 0),
+    }
+
+
+def bench_listing(client: TestClient, args) -> dict:
+    def walk(label: str) -> dict:
+        cursor = [None]
+
+        def send(_):
+            params = {"limit": args.page_size}
+            if cursor[0]:
+                params["cursor"] = cursor[0]
+            cursor[0] = client.get("/flashcards/", params=params).json()["next_cursor"]
+
+        return summarize(*timed_requests(send, args.list_requests), mode=label)
+
+    deck_cache.invalidate()
+    cold = walk("store")
+    db.get_flashcards("anonymous_user")
+    return {"store": cold, "cached": walk("cached")}
+
+
+def bench_search(client: TestClient, args, rng: random.Random) -> dict:
+    queries = [" ".join(synthetic_text(rng, 1).split()[:rng.randint(1, 3)]) for _ in range(args.queries)]
+    results = {}
+    for mode in MODES:
+        # The first query loads the deck into the index; reported separately
+        start = time.perf_counter()
+        client.post("/search-flashcards", json={"query": queries[0], "mode": mode})
+        load_ms = (time.perf_counter() - start) * 1000
+        results[mode] = summarize(
+            *timed_requests(lambda i: client.post("/search-flashcards", json={"query": queries[i], "mode": mode}),
+                            len(queries)),
+            index_load_ms=round(load_ms, 3),
+        )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--scenarios", nargs="+", default=["upload", "listing", "search"],
+                        choices=["upload", "batch", "listing", "search"])
+    parser.add_argument("--deck-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--preset", default="small", help=f"one of {sorted(PDF_PRESETS)} or a page count")
+    parser.add_argument("--n-cards", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--list-requests", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--storage", default="supabase", choices=["supabase", "sqlite"],
+                        help="fake Supabase with --db-latency, or a real SQLite file")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per Supabase request")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="seconds per Gemini call")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embedding request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake remote calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # One line per test request would drown the results
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "results": {},
+    }
+    with TestClient(app) as client, tempfile.TemporaryDirectory() as tmpdir:
+        # After startup, so the lifespan's provider resolution cannot replace the fakes
+        install_fakes(args, tmpdir)
+        if "upload" in args.scenarios:
+            report["results"]["upload"] = bench_upload(client, args, tmpdir)
+            print(f"upload: {json.dumps(report['results']['upload'])}")
+        if "batch" in args.scenarios:
+            report["results"]["batch"] = bench_batch(client, args, tmpdir)
+            print(f"batch: {json.dumps(report['results']['batch'])}")
+
+        for size in args.deck_sizes:
+            if not {"listing", "search"} & set(args.scenarios):
+                break
+            seed_deck(args, tmpdir, size, rng)
+            deck = report["results"].setdefault(f"deck_{size}", {})
+            if "listing" in args.scenarios:
+                deck["listing"] = bench_listing(client, args)
+            if "search" in args.scenarios:
+                deck["search"] = bench_search(client, args, rng)
+            for scenario, modes in deck.items():
+                for mode, stats in modes.items():
+                    print(f"deck {size:>7} {scenario:>8} {mode:>8}: p50 {stats['p50_ms']:.2f}ms "
+                          f"p95 {stats['p95_ms']:.2f}ms p99 {stats['p99_ms']:.2f}ms "
+                          f"{stats['throughput_per_s']}/s")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
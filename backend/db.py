@@ -1,89 +1,303 @@
-import os
-from supabase import create_client
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-TABLE = "flashcards"
-
-# Initialize supabase client with error handling
-try:
-    if SUPABASE_URL and SUPABASE_KEY:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase client initialized successfully")
-    else:
-        print("Warning: Supabase credentials not found")
-        supabase = None
-except Exception as e:
-    print(f"Error initializing Supabase: {e}")
-    supabase = None
+import json
+import base64
+import logging
+from datetime import datetime
+
+from deck_cache import deck_cache
+from embedding_codec import to_storage
+from metrics import ERRORS, provider_call
+from storage import create_backend, COLUMNS
+
+log = logging.getLogger(__name__)
+
+# Columns returned by listings unless the caller asks for others; embeddings are opt-in
+DEFAULT_FIELDS = ("id", "question", "answer", "difficulty", "created_at")
+
+# Storage backend chosen by STORAGE_BACKEND; None means writes are dropped
+backend = create_backend()
+
+def set_backend(new_backend):
+    """Swap the storage backend, e.g. for a local store in tests and benchmarks"""
+    global backend
+    backend = new_backend
+    deck_cache.invalidate()
+
+# Callables notified after successful writes as listener(event, user_id, rows)
+# where event is "insert", "update" or "delete" and rows are the affected rows
+_listeners = []
+
+def subscribe(listener):
+    """Register a listener for flashcard writes (indexes, caches, counters)"""
+    _listeners.append(listener)
+
+def _notify(event: str, rows: list):
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.get("user_id"), []).append(row)
+    for user_id, user_rows in by_user.items():
+        for listener in _listeners:
+            try:
+                listener(event, user_id, user_rows)
+            except Exception:
+                log.exception("Flashcard listener failed", extra={"event": event})
+                ERRORS.inc(component="db.listener")
+
+subscribe(deck_cache.on_write)
+
+def _call(method: str, *args):
+    """Run a backend operation, timed as a provider call"""
+    with provider_call(backend.name):
+        return getattr(backend, method)(*args)
+
+def flashcard_row(user_id: str, card: dict, embedding: list, created_at: str = None, embedding_model: str = None):
+    row = {
+        "user_id":   user_id,
+        "question":  card["question"],
+        "answer":    card["answer"],
+        "embedding": to_storage(embedding),
+        "created_at": created_at or datetime.utcnow().isoformat(),
+        "difficulty": card.get("difficulty", "medium")
+    }
+    # Source document name, for per-document stats; see migrations/001_document_tracking.sql
+    if card.get("document"):
+        row["document"] = card["document"]
+    # Vectors of different models share a size but not a space; see migrations/002_embedding_model.sql
+    if embedding_model:
+        row["embedding_model"] = embedding_model
+    return row
 
 def save_flashcard(user_id: str, card: dict, embedding: list):
     """Save flashcard to database"""
     try:
-        if not supabase:
-            print("Supabase not available, skipping save")
+        if not backend:
+            log.debug("Storage not available, skipping save")
+            return
+
+        from dedupe import near_duplicates, DEDUPE_ENABLED
+        duplicate_of = near_duplicates.find(user_id, card) if DEDUPE_ENABLED else None
+        if duplicate_of is not None:
+            log.info("Skipping near-duplicate flashcard", extra={"user_id": user_id, "duplicate_of": duplicate_of})
             return
             
-        from datetime import datetime
-        
-        result = supabase.table(TABLE).insert({
-            "user_id":   user_id,
-            "question":  card["question"],
-            "answer":    card["answer"],
-            "embedding": embedding,
-            "created_at": datetime.utcnow().isoformat(),
-            "difficulty": card.get("difficulty", "medium")
-        }).execute()
+        _notify("insert", _call("insert", [flashcard_row(user_id, card, embedding)]))
         
-        print(f"Flashcard saved successfully: {card['question'][:50]}...")
+        log.debug("Flashcard saved", extra={"user_id": user_id})
         
+    except Exception:
+        log.exception("Saving flashcard failed")
+        ERRORS.inc(component="db")
+
+def insert_rows(rows: list):
+    """Insert prepared rows in one request.
+
+    If the bulk insert fails, rows are retried one at a time so a single bad
+    row does not sink the rest. Returns (saved_rows, errors) where each error
+    is {"index": i, "error": message} for rows[i].
+    """
+    if not rows:
+        return [], []
+    if not backend:
+        log.debug("Storage not available, skipping save")
+        return [], [{"index": i, "error": "Storage not available"} for i in range(len(rows))]
+
+    try:
+        saved = _call("insert", rows)
+        _notify("insert", saved)
+        return saved, []
     except Exception as e:
-        print(f"Error saving flashcard: {e}")
+        log.warning("Bulk insert failed, retrying per row", extra={"rows": len(rows), "error": str(e)})
+        ERRORS.inc(component="db.bulk_insert")
+
+    saved, errors = [], []
+    for i, row in enumerate(rows):
+        try:
+            saved.extend(_call("insert", [row]))
+        except Exception as e:
+            errors.append({"index": i, "error": str(e)})
+    _notify("insert", saved)
+    return saved, errors
+
+def save_flashcards(user_id: str, cards: list, embeddings: list, embedding_models: list = None):
+    """Save many flashcards in a single insert"""
+    created_at = datetime.utcnow().isoformat()
+    models = embedding_models or [None] * len(cards)
+    rows = [flashcard_row(user_id, card, emb, created_at, model) for card, emb, model in zip(cards, embeddings, models)]
+    saved, errors = insert_rows(rows)
+    log.info("Saved flashcards", extra={"user_id": user_id, "saved": len(saved), "failed": len(errors)})
+    return {"saved": saved, "errors": errors}
+
+def load_flashcards(user_id: str):
+    """Get all flashcards for a user, served from the deck cache when warm; raises on failure"""
+    if not backend:
+        log.debug("Storage not available, returning empty list")
+        return []
+
+    cached = deck_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    version = deck_cache.version(user_id)
+    flashcards = _call("select", user_id)
+    deck_cache.put(user_id, flashcards, version)
+    log.debug("Retrieved flashcards", extra={"user_id": user_id, "count": len(flashcards)})
+    return flashcards
 
 def get_flashcards(user_id: str):
-    """Get all flashcards for a user"""
+    """Get all flashcards for a user, or an empty list if they cannot be fetched"""
     try:
-        if not supabase:
-            print("Supabase not available, returning empty list")
-            return []
-            
-        result = supabase.table(TABLE).select("*").eq("user_id", user_id).execute()
-        flashcards = result.data if result.data else []
-        print(f"Retrieved {len(flashcards)} flashcards for user {user_id}")
-        return flashcards
-        
-    except Exception as e:
-        print(f"Error getting flashcards: {e}")
+        return load_flashcards(user_id)
+    except Exception:
+        log.exception("Getting flashcards failed")
+        ERRORS.inc(component="db")
         return []
 
+def encode_cursor(card: dict) -> str:
+    raw = json.dumps([card.get("created_at"), card.get("id")]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Turn a cursor back into (created_at, id); raises ValueError if malformed"""
+    try:
+        created_at, card_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, card_id
+
+def check_fields(fields: list = None) -> list:
+    """The fields to return for a listing; raises ValueError naming any unknown column"""
+    fields = list(fields or DEFAULT_FIELDS)
+    unknown = [field for field in fields if field not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def _list_page(user_id: str, fields: list, limit: int = None, after: tuple = None):
+    if not backend:
+        log.debug("Storage not available, returning empty list")
+        return [], None
+
+    # One extra row tells us whether another page exists
+    rows = deck_cache.page(user_id, after, limit + 1 if limit else None)
+    if rows is None:
+        # The cursor is built from these, so they are always selected
+        columns = list(dict.fromkeys(fields + ["created_at", "id"]))
+        rows = _call("select_page", user_id, columns, limit + 1 if limit else None, after)
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return [{field: row.get(field) for field in fields} for row in rows], next_cursor
+
+def list_flashcards(user_id: str, fields: list = None, limit: int = None, after: tuple = None):
+    """Page through a user's flashcards in (created_at, id) order.
+
+    Only `fields` are returned (embeddings are left out by default); unknown
+    fields raise ValueError. `after` is a decoded cursor; the next one is
+    returned alongside the page and is None once the deck is exhausted.
+    Returns (cards, next_cursor).
+    """
+    fields = check_fields(fields)
+    try:
+        return _list_page(user_id, fields, limit, after)
+    except Exception:
+        log.exception("Listing flashcards failed")
+        ERRORS.inc(component="db")
+        return [], None
+
+def iter_flashcards(user_id: str, fields: list = None, page_size: int = 500):
+    """Yield every card page by page, holding at most one page in memory.
+
+    A page that cannot be fetched raises rather than ending the iteration
+    early, so a partial listing is never mistaken for the whole deck.
+    """
+    fields = check_fields(fields)
+    after = None
+    while True:
+        try:
+            cards, next_cursor = _list_page(user_id, fields, page_size, after)
+        except Exception:
+            log.exception("Listing flashcards failed", extra={"user_id": user_id, "after": after})
+            ERRORS.inc(component="db")
+            raise
+        yield from cards
+        if not next_cursor:
+            return
+        after = decode_cursor(next_cursor)
+
 def delete_flashcard(card_id: int, user_id: str):
     """Delete a flashcard"""
     try:
-        if not supabase:
-            print("Supabase not available, cannot delete")
+        if not backend:
+            log.debug("Storage not available, cannot delete")
             return False
             
-        result = supabase.table(TABLE).delete().eq("id", card_id).eq("user_id", user_id).execute()
-        success = len(result.data) > 0
-        print(f"Deleted flashcard {card_id}: {success}")
+        deleted = _call("delete", user_id, [card_id])
+        success = len(deleted) > 0
+        _notify("delete", deleted)
+        log.debug("Deleted flashcard", extra={"card_id": card_id, "success": success})
         return success
         
-    except Exception as e:
-        print(f"Error deleting flashcard: {e}")
+    except Exception:
+        log.exception("Deleting flashcard failed")
+        ERRORS.inc(component="db")
         return False
 
+def delete_flashcards(card_ids: list, user_id: str):
+    """Delete many flashcards in one request; returns how many were removed"""
+    try:
+        if not backend or not card_ids:
+            return 0
+
+        deleted = _call("delete", user_id, list(card_ids))
+        _notify("delete", deleted)
+        log.info("Deleted flashcards", extra={"user_id": user_id, "count": len(deleted)})
+        return len(deleted)
+
+    except Exception:
+        log.exception("Deleting flashcards failed")
+        ERRORS.inc(component="db")
+        return 0
+
+def get_manifest(user_id: str, document: str):
+    """Get the stored manifest of a document, or None if it was never ingested"""
+    try:
+        if not backend:
+            return None
+
+        return _call("get_manifest", user_id, document)
+
+    except Exception:
+        log.exception("Getting manifest failed", extra={"document": document})
+        ERRORS.inc(component="db")
+        return None
+
+def save_manifest(user_id: str, document: str, manifest: dict):
+    """Create or replace a document's manifest"""
+    try:
+        if not backend:
+            return
+
+        _call("save_manifest", user_id, document, manifest, datetime.utcnow().isoformat())
+
+    except Exception:
+        log.exception("Saving manifest failed", extra={"document": document})
+        ERRORS.inc(component="db")
+
 def update_flashcard(card_id: int, user_id: str, updates: dict):
     """Update a flashcard"""
     try:
-        if not supabase:
-            print("Supabase not available, cannot update")
+        if not backend:
+            log.debug("Storage not available, cannot update")
             return None
             
-        result = supabase.table(TABLE).update(updates).eq("id", card_id).eq("user_id", user_id).execute()
-        updated_card = result.data[0] if result.data else None
-        print(f"Updated flashcard {card_id}: {updated_card is not None}")
+        updated = _call("update", user_id, card_id, updates)
+        updated_card = updated[0] if updated else None
+        _notify("update", updated)
+        log.debug("Updated flashcard", extra={"card_id": card_id, "success": updated_card is not None})
         return updated_card
         
-    except Exception as e:
-        print(f"Error updating flashcard: {e}")
+    except Exception:
+        log.exception("Updating flashcard failed")
+        ERRORS.inc(component="db")
         return None
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+DECK_CACHE_MAX_BYTES = int(os.getenv("DECK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DECK_CACHE_TTL = float(os.getenv("DECK_CACHE_TTL", "300"))
+
+# Rough per-row overhead of the dict and its keys, in bytes
+_ROW_OVERHEAD = 400
+
+
+def deck_order(card: dict):
+    """Sort key of the (created_at, id) order decks are kept and paged in"""
+    return (card.get("created_at") or "", card.get("id") or 0)
+
+
+def estimate_size(rows: list) -> int:
+    """Approximate memory held by a deck; strings at 1 byte/char, floats at 32 bytes"""
+    size = 0
+    for row in rows:
+        size += _ROW_OVERHEAD
+        for value in row.values():
+            if isinstance(value, str):
+                size += len(value)
+            elif isinstance(value, (list, tuple)):
+                size += 32 * len(value)
+    return size
+
+
+class DeckCache:
+    """Per-user LRU of full decks, bounded by estimated memory and a TTL.
+
+    Decks are kept in deck_order, so a page is a bisect and a slice.
+    Writes patch cached decks in place (see on_write) rather than dropping
+    them, so a deck stays warm across uploads, edits and deletes. Each write
+    also bumps the user's version, and a deck fetched while the version
+    moved is not cached, since the fetch may have missed that write.
+    """
+
+    def __init__(self, max_bytes: int = DECK_CACHE_MAX_BYTES, ttl: float = DECK_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.decks = OrderedDict()  # user_id -> (rows, size, loaded_at)
+        self.versions = {}  # user_id -> writes seen
+        self.generation = 0  # bumped by a full invalidate
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_puts = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_id: str):
+        """The live cache entry, counting a hit or miss; call with the lock held"""
+        entry = self.decks.get(user_id)
+        if entry is None or time.monotonic() - entry[2] > self.ttl:
+            if entry is not None:
+                self._drop(user_id)
+            self.misses += 1
+            return None
+        self.decks.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def get(self, user_id: str):
+        """Return a copy of the cached deck, or None on a miss"""
+        with self._lock:
+            entry = self._lookup(user_id)
+            return list(entry[0]) if entry is not None else None
+
+    def page(self, user_id: str, after: tuple = None, limit: int = None):
+        """Up to limit cached cards strictly after the (created_at, id) key, or None on a miss"""
+        with self._lock:
+            entry = self._lookup(user_id)
+            if entry is None:
+                return None
+            deck = entry[0]
+            start = bisect_right(deck, tuple(after), key=deck_order) if after else 0
+            return deck[start:start + limit] if limit else deck[start:]
+
+    def version(self, user_id: str):
+        """Take before fetching a deck and pass to put(), which drops the deck if a write intervened"""
+        with self._lock:
+            return self.generation, self.versions.get(user_id, 0)
+
+    def put(self, user_id: str, rows: list, version=None):
+        with self._lock:
+            if version is not None and version != (self.generation, self.versions.get(user_id, 0)):
+                self.stale_puts += 1
+                return
+            self._store(user_id, sorted(rows, key=deck_order), time.monotonic())
+
+    def _bump(self, user_id: str):
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def _store(self, user_id: str, rows: list, loaded_at: float):
+        self._drop(user_id)
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        self.decks[user_id] = (rows, size, loaded_at)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            oldest = next(iter(self.decks))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, user_id: str):
+        entry = self.decks.pop(user_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def invalidate(self, user_id: str = None):
+        with self._lock:
+            if user_id is None:
+                self.decks.clear()
+                self.total_bytes = 0
+                self.generation += 1
+            else:
+                self._drop(user_id)
+                self._bump(user_id)
+
+    def on_write(self, event: str, user_id: str, rows: list):
+        """Patch a cached deck after a write; decks not in cache are left alone"""
+        with self._lock:
+            self._bump(user_id)
+            entry = self.decks.get(user_id)
+            if entry is None:
+                return
+            deck, _, loaded_at = entry
+            changed = {row.get("id"): row for row in rows}
+            if event == "insert":
+                deck = list(deck)
+                for row in rows:
+                    insort(deck, row, key=deck_order)
+            elif event == "update":
+                deck = [{**card, **changed[card.get("id")]} if card.get("id") in changed else card
+                        for card in deck]
+            elif event == "delete":
+                deck = [card for card in deck if card.get("id") not in changed]
+            # Keep the original load time so the TTL still bounds drift from the store
+            self._store(user_id, deck, loaded_at)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self.decks),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "stale_puts": self.stale_puts,
+            }
+
+
+deck_cache = DeckCache()
@@ -0,0 +1,139 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+import db
+from lazy_index import LazyUserIndex
+
+# Estimated Jaccard similarity at or above which two cards count as duplicates
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+DEDUPE_ENABLED = os.getenv("DEDUPE_ENABLED", "true").lower() in ("1", "true", "yes")
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs near Jaccard 0.7 and above almost always share a band
+BANDS = 16
+SHINGLE_CHARS = 4
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def shingles(card: dict) -> set:
+    """Character shingles of the normalised question and answer"""
+    text = " ".join(_WORD.findall(f"{card.get('question', '')} {card.get('answer', '')}".lower()))
+    if len(text) <= SHINGLE_CHARS:
+        return {text}
+    return {text[i:i + SHINGLE_CHARS] for i in range(len(text) - SHINGLE_CHARS + 1)}
+
+
+def signature(card: dict) -> np.ndarray:
+    """MinHash signature; matching positions estimate Jaccard similarity of the shingle sets"""
+    hashes = np.fromiter((zlib.crc32(s.encode()) % _PRIME for s in shingles(card)), dtype=np.uint64)
+    # a * h + b stays below 2**63, so the universal hash cannot overflow uint64
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def _bands(sig: np.ndarray):
+    rows = NUM_PERM // BANDS
+    return [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+
+class _UserLSH:
+    """LSH buckets over one user's card signatures"""
+
+    def __init__(self):
+        self.signatures = {}
+        self.buckets = {}  # (band, band bytes) -> set of card ids
+
+    def add(self, card_id, sig: np.ndarray):
+        self.remove(card_id)
+        self.signatures[card_id] = sig
+        for key in _bands(sig):
+            self.buckets.setdefault(key, set()).add(card_id)
+
+    def remove(self, card_id):
+        sig = self.signatures.pop(card_id, None)
+        if sig is None:
+            return
+        for key in _bands(sig):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(card_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def match(self, sig: np.ndarray, threshold: float):
+        """Id of the most similar indexed card at or above threshold, else None"""
+        candidates = set()
+        for key in _bands(sig):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, threshold
+        for card_id in candidates:
+            score = float(np.mean(self.signatures[card_id] == sig))
+            if score >= best_score:
+                best, best_score = card_id, score
+        return best
+
+
+class NearDuplicateIndex(LazyUserIndex):
+    """Per-user MinHash/LSH index for spotting near-identical cards before insert.
+
+    Lookups touch only the cards sharing an LSH band with the new card, so
+    checking a card does not scan the deck. Like the search indexes, a
+    deck is loaded on first use and then kept in sync from db writes.
+    """
+
+    def __init__(self, threshold: float = DEDUPE_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def _build(self, rows: list) -> _UserLSH:
+        index = _UserLSH()
+        self._apply(index, "insert", rows)
+        return index
+
+    def _apply(self, index: _UserLSH, event: str, rows: list):
+        for row in rows:
+            if row.get("id") is None:
+                continue
+            if event == "delete":
+                index.remove(row["id"])
+            elif "question" in row or "answer" in row:
+                index.add(row["id"], signature(row))
+
+    def find(self, user_id: str, card: dict):
+        """Id of a stored card that card nearly duplicates, or None"""
+        index = self._get(user_id)
+        with self._lock:
+            return index.match(signature(card), self.threshold)
+
+    def filter(self, user_id: str, cards: list):
+        """Split cards into (indexes to keep, duplicates).
+
+        Each duplicate is {"index": i, "duplicate_of": card id}, pointing at a
+        stored card, or at "batch:j" for an earlier card j of the same batch.
+        """
+        batch = _UserLSH()
+        keep, duplicates = [], []
+        index = self._get(user_id)
+        with self._lock:
+            for i, card in enumerate(cards):
+                sig = signature(card)
+                match = index.match(sig, self.threshold)
+                if match is None:
+                    match = batch.match(sig, self.threshold)
+                    match = None if match is None else f"batch:{match}"
+                if match is None:
+                    batch.add(i, sig)
+                    keep.append(i)
+                else:
+                    duplicates.append({"index": i, "duplicate_of": match})
+        return keep, duplicates
+
+
+near_duplicates = NearDuplicateIndex()
+db.subscribe(near_duplicates.on_write)
@@ -0,0 +1,115 @@
+import json
+import base64
+import struct
+
+import numpy as np
+
+VERSION = 1
+MAGIC = b"QE"
+# Text form of an encoded embedding, safe in JSON and text columns
+TEXT_PREFIX = "qe:"
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_KIND_CODES = {"float32": 0, "float16": 1, "int8": 2}
+_KINDS = {code: kind for kind, code in _KIND_CODES.items()}
+
+# magic, version, kind
+_HEADER = struct.Struct("<2sBB")
+# Per-vector scale, int8 only
+_SCALE = struct.Struct("<f")
+
+
+def quantize(vectors, kind: str):
+    """Return (codes, scales) with vectors ~= codes * scales[..., None].
+
+    Works on one vector or a matrix of them. int8 maps each vector's largest
+    magnitude to 127; the float kinds are plain casts with a scale of 1.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if kind == "int8":
+        peak = np.abs(vectors).max(axis=-1)
+        scales = np.where(peak > 0, peak / 127, 1).astype(np.float32)
+        codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+        return codes, scales
+    return vectors.astype(DTYPES[kind]), np.ones(vectors.shape[:-1], dtype=np.float32)
+
+
+def encode(vec, kind: str = "int8") -> bytes:
+    """Versioned binary form: header, the int8 scale if any, then the packed values"""
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    header = _HEADER.pack(MAGIC, VERSION, _KIND_CODES[kind])
+    if kind == "int8":
+        codes, scale = quantize(vec, kind)
+        return header + _SCALE.pack(scale) + codes.tobytes()
+    return header + vec.astype(DTYPES[kind]).tobytes()
+
+
+def to_text(blob: bytes) -> str:
+    return TEXT_PREFIX + base64.b64encode(blob).decode("ascii")
+
+
+def from_text(text: str) -> bytes:
+    return base64.b64decode(text[len(TEXT_PREFIX):])
+
+
+def is_encoded_text(value) -> bool:
+    return isinstance(value, str) and value.startswith(TEXT_PREFIX)
+
+
+def to_storage(embedding, kind: str = "list"):
+    """The value written to an embedding column: plain floats for "list", else encoded text.
+
+    Already-encoded strings pass through untouched, so reading a card back
+    and saving it again does not quantize twice.
+    """
+    if embedding is None or is_encoded_text(embedding):
+        return embedding
+    if kind == "list":
+        return embedding.tolist() if hasattr(embedding, "tolist") else embedding
+    return to_text(encode(embedding, kind))
+
+
+def _tagged_kind(blob: bytes):
+    """The kind a versioned blob holds, or None for a legacy raw float32 blob"""
+    if len(blob) < _HEADER.size or blob[:2] != MAGIC:
+        return None
+    _, version, code = _HEADER.unpack_from(blob)
+    if version > VERSION:
+        raise ValueError(f"Unsupported embedding encoding version {version}")
+    kind = _KINDS.get(code)
+    if kind is None:
+        return None
+    payload = len(blob) - _HEADER.size - (_SCALE.size if kind == "int8" else 0)
+    # Reject payloads that cannot hold whole values of the tagged kind
+    if payload <= 0 or payload % np.dtype(DTYPES[kind]).itemsize:
+        return None
+    return kind
+
+
+def is_encoded_blob(blob) -> bool:
+    return _tagged_kind(bytes(blob)) is not None
+
+
+def decode(value):
+    """Any stored embedding as a float32 NumPy vector, or None when absent.
+
+    Accepts encoded bytes or their text form, legacy raw float32 bytes,
+    lists, arrays, and JSON or pgvector '[...]' strings.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = from_text(value) if is_encoded_text(value) else json.loads(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        blob = bytes(value)
+        kind = _tagged_kind(blob)
+        if kind is None:
+            vec = np.frombuffer(blob, dtype=np.float32)
+        elif kind == "int8":
+            (scale,) = _SCALE.unpack_from(blob, _HEADER.size)
+            vec = np.frombuffer(blob, dtype=np.int8, offset=_HEADER.size + _SCALE.size).astype(np.float32) * scale
+        else:
+            vec = np.frombuffer(blob, dtype=DTYPES[kind], offset=_HEADER.size).astype(np.float32)
+        return vec if vec.size else None
+    vec = np.asarray(value, dtype=np.float32).ravel()
+    return vec if vec.size else None
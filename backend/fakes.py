@@ -0,0 +1,286 @@
+"""In-process stand-ins for remote services and inputs, for tests and benchmarks."""
+import re
+import json
+import time
+import random
+import threading
+
+import fitz
+
+from local_embeddings import LocalEmbedder
+
+
+class _Faults:
+    """Shared latency and failure injection for the fake services"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self) -> int:
+        """Count a call, wait out its latency and maybe fail it; returns the call number"""
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.failures += 1
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("Injected provider failure")
+        return call
+
+
+def _fake_cards(call: int, text: str, n_cards: int) -> list:
+    words = text.split()
+    return [
+        {
+            "question": f"What does passage {call}.{i} say about {' '.join(words[i:i + 3]) or 'the topic'}?",
+            "answer": " ".join(words[i * 8:i * 8 + 12]) or "Not stated",
+            "difficulty": "medium",
+        }
+        for i in range(n_cards)
+    ]
+
+
+class FakeGenerator(_Faults):
+    """Flashcard provider with configurable latency and failure rate.
+
+    Matches the generator(text, n_cards) signature used by generate_flashcards
+    and generate_flashcards_chunked.
+    """
+
+    def __call__(self, text: str, n_cards: int = 5) -> list:
+        return _fake_cards(self._call(), text, n_cards)
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGemini(_Faults):
+    """Stands in for a google.generativeai GenerativeModel.
+
+    Reads the card count and source text out of the flashcard prompt and
+    answers with a JSON array, so the real prompt and parsing code runs.
+    """
+
+    _COUNT = re.compile(r"Create (\d+)")
+    _TEXT = re.compile(r"TEXT TO PROCESS:\s*(.*?)\s*Generate exactly", re.S)
+
+    def generate_content(self, prompt: str) -> _FakeResponse:
+        call = self._call()
+        count = self._COUNT.search(prompt)
+        text = self._TEXT.search(prompt)
+        cards = _fake_cards(call, text.group(1) if text else prompt, int(count.group(1)) if count else 5)
+        return _FakeResponse(json.dumps([{"question": c["question"], "answer": c["answer"]} for c in cards]))
+
+    def count_tokens(self, text: str):
+        self._call()
+        return {"total_tokens": len(text.split())}
+
+
+class FakeEmbeddingClient(_Faults):
+    """Stands in for the Hugging Face InferenceClient used for embeddings.
+
+    Vectors come from the local n-gram embedder, so they are deterministic
+    and similar texts still land near each other.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.embedder = LocalEmbedder()
+
+    def feature_extraction(self, text):
+        self._call()
+        if isinstance(text, str):
+            return self.embedder.embed([text])[0]
+        return self.embedder.embed(list(text))
+
+
+class _FakeResult:
+    def __init__(self, data: list):
+        self.data = data
+
+
+class _FakeQuery:
+    """Just enough of the supabase-py query builder for db.py"""
+
+    _KEYSET = re.compile(r'created_at\.gt\."([^"]*)",and\(created_at\.eq\."[^"]*",id\.gt\.(-?\d+)\)')
+
+    def __init__(self, client, table: str):
+        self.client = client
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.columns = None
+        self.filters = []
+        self.ordering = []
+        self.max_rows = None
+        self.after = None
+        self.on_conflict = []
+
+    def select(self, columns: str = "*"):
+        self.op, self.columns = "select", None if columns == "*" else columns.split(",")
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload: dict):
+        self.op, self.payload = "update", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id"):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict.split(",")
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values: list):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, expression: str):
+        # Only the keyset condition list_flashcards builds is understood
+        match = self._KEYSET.fullmatch(expression)
+        if not match:
+            raise ValueError(f"Unsupported or_ filter: {expression}")
+        self.after = (match.group(1), int(match.group(2)))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.ordering.append(column)
+        return self
+
+    def limit(self, count: int):
+        self.max_rows = count
+        return self
+
+    def _matches(self, row: dict) -> bool:
+        return all(test(row) for test in self.filters)
+
+    def execute(self) -> _FakeResult:
+        self.client._call()
+        with self.client._store_lock:
+            rows = self.client.tables.setdefault(self.table, [])
+            return _FakeResult(getattr(self, f"_{self.op}")(rows))
+
+    def _select(self, rows: list) -> list:
+        found = [row for row in rows if self._matches(row)]
+        if self.ordering:
+            found.sort(key=lambda row: tuple(row.get(column) for column in self.ordering))
+        if self.after:
+            found = [row for row in found if (row.get("created_at"), row.get("id")) > self.after]
+        if self.max_rows is not None:
+            found = found[:self.max_rows]
+        if self.columns:
+            return [{column: row.get(column) for column in self.columns} for row in found]
+        return [dict(row) for row in found]
+
+    def _insert(self, rows: list) -> list:
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        saved = []
+        for row in payload:
+            row = {**row, "id": self.client._next_id()}
+            rows.append(row)
+            saved.append(dict(row))
+        return saved
+
+    def _upsert(self, rows: list) -> list:
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        saved = []
+        for row in payload:
+            key = [row.get(column) for column in self.on_conflict]
+            rows[:] = [old for old in rows if [old.get(column) for column in self.on_conflict] != key]
+            rows.append(dict(row))
+            saved.append(dict(row))
+        return saved
+
+    def _update(self, rows: list) -> list:
+        updated = []
+        for row in rows:
+            if self._matches(row):
+                row.update(self.payload)
+                updated.append(dict(row))
+        return updated
+
+    def _delete(self, rows: list) -> list:
+        deleted = [row for row in rows if self._matches(row)]
+        rows[:] = [row for row in rows if not self._matches(row)]
+        return deleted
+
+
+class FakeSupabase(_Faults):
+    """In-memory Supabase client; use it with db.set_backend(SupabaseBackend(fake)).
+
+    Every execute() pays the configured latency and may fail, like a
+    network round trip would. Rows get increasing integer ids.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tables = {}
+        self._ids = 0
+        self._store_lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        self._ids += 1
+        return self._ids
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+
+# Pages per synthetic document
+PDF_PRESETS = {"small": 5, "medium": 40, "large": 200}
+
+_TOPICS = ["photosynthesis", "mitochondria", "osmosis", "entropy", "inflation", "compilers", "gravity",
+           "mitosis", "neurons", "enzymes", "the kernel", "supply chains", "plate tectonics", "vaccines"]
+_FILLER = ("energy process cell system structure function model signal layer pattern theory market "
+           "policy membrane protein reaction pressure velocity network memory circuit").split()
+
+
+def synthetic_text(rng: random.Random, sentences: int) -> str:
+    """Textbook-like prose with definitions, facts and keyword sentences"""
+    out = []
+    for _ in range(sentences):
+        topic = rng.choice(_TOPICS).capitalize()
+        body = " ".join(rng.choices(_FILLER, k=rng.randint(6, 14)))
+        out.append(rng.choice([
+            f"{topic} is the {body}.",
+            f"{topic} contains {body}.",
+            f"It is important that {body}.",
+            f"{topic} refers to {body}.",
+            f"{body.capitalize()}.",
+        ]))
+    return " ".join(out)
+
+
+def make_pdf(path: str, preset="small", seed: int = 0) -> int:
+    """Write a synthetic PDF; preset is a PDF_PRESETS name or a page count. Returns the page count"""
+    n_pages = PDF_PRESETS[preset] if isinstance(preset, str) else int(preset)
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        box = fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36)
+        page.insert_textbox(box, f"Page {i + 1}. " + synthetic_text(rng, 25), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return n_pages
@@ -0,0 +1,191 @@
+"""Single-pass rule engine behind generate_flashcards_fallback.
+
+Rules fire in priority order: definitions, then facts, numbered items,
+comparisons and finally sentences with important keywords. Cards from a
+higher-priority rule always come first, so the engine scans the text
+once, collecting each rule's candidates per sentence, and stops early as
+soon as the top rule alone has enough cards.
+"""
+import re
+
+_SPECIAL_CHARS = re.compile(r'[^\w\s.,!?;:()\-]+')
+# A sentence is everything up to and including a terminator
+_SENTENCE = re.compile(r'[^.!?]*[.!?]')
+_TERMINATORS = re.compile(r'[.!?]+')
+
+_SUBJECT = r'([A-Z][a-zA-Z\s]{2,30})'
+
+# (trigger verb, pattern, question template); list order is rule priority
+DEFINITION_RULES = [
+    ("is", _SUBJECT + r'\s+is\s+([^.!?]{10,80})[.!?]', "What is {}?"),
+    ("means", _SUBJECT + r'\s+means\s+([^.!?]{10,80})[.!?]', "What does {} mean?"),
+    ("refers", _SUBJECT + r'\s+refers to\s+([^.!?]{10,80})[.!?]', "What does {} refer to?"),
+    ("is", r'A\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is a {}?"),
+    ("is", r'An\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is an {}?"),
+    ("is", r'The\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is the {}?"),
+    ("defined", _SUBJECT + r'\s+can be defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
+    ("is", _SUBJECT + r'\s+is defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
+]
+FACT_RULES = [
+    ("has", _SUBJECT + r'\s+has\s+([^.!?]{5,60})[.!?]', "What does {} have?"),
+    ("contains", _SUBJECT + r'\s+contains\s+([^.!?]{5,60})[.!?]', "What does {} contain?"),
+    ("includes", _SUBJECT + r'\s+includes\s+([^.!?]{5,60})[.!?]', "What does {} include?"),
+    ("performs", _SUBJECT + r'\s+performs\s+([^.!?]{5,60})[.!?]', "What does {} perform?"),
+    ("provides", _SUBJECT + r'\s+provides\s+([^.!?]{5,60})[.!?]', "What does {} provide?"),
+    ("ensures", _SUBJECT + r'\s+ensures\s+([^.!?]{5,60})[.!?]', "What does {} ensure?"),
+    ("are", _SUBJECT + r'\s+are\s+([^.!?]{5,60})[.!?]', "What are {}?"),
+]
+
+# One alternation with a named group per trigger verb; a sentence only runs
+# the rules whose verb it contains
+_TRIGGER_WORDS = {
+    "is": "is",
+    "means": "means",
+    "refers": "refers to",
+    "defined": "can be defined as",
+    "has": "has",
+    "contains": "contains",
+    "includes": "includes",
+    "performs": "performs",
+    "provides": "provides",
+    "ensures": "ensures",
+    "are": "are",
+}
+# Lookarounds keep adjacent triggers ("X is has ...") from consuming each other's spaces
+_TRIGGERS = re.compile("|".join(f"(?P<{name}>(?<=\\s){words}(?=\\s))" for name, words in _TRIGGER_WORDS.items()),
+                       re.IGNORECASE)
+
+_NUMBERED = re.compile(r'(\d+)[.)]\s*([^.!?]{10,100})[.!?]')
+_COMPARISON = re.compile(r'different|similar|compare|contrast|versus|vs', re.IGNORECASE)
+_QUESTION_WORDS = re.compile(r'what|how|why|when|where|which')
+_IMPORTANT_WORDS = re.compile(r'important|key|main|primary|essential|significant|'
+                              r'must|should|required|necessary|critical|fundamental')
+
+
+class _Rule:
+    def __init__(self, trigger: str, pattern: str, template: str, min_len: int, max_len: int,
+                 reject_questions: bool):
+        self.trigger = trigger
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.template = template
+        self.min_len = min_len
+        self.max_len = max_len
+        self.reject_questions = reject_questions
+
+    def cards(self, sentence: str):
+        for match in self.regex.finditer(sentence):
+            term = " ".join(match.group(1).split())
+            body = " ".join(match.group(2).split())
+            if len(term) < 3 or len(term) > 40 or len(body) < self.min_len or len(body) > self.max_len:
+                continue
+            if self.reject_questions and _QUESTION_WORDS.search(body.lower()):
+                continue
+            yield {"question": self.template.format(term.lower()), "answer": body, "difficulty": "medium"}
+
+
+RULES = (
+    [_Rule(trigger, pattern, template, 8, 100, True) for trigger, pattern, template in DEFINITION_RULES]
+    + [_Rule(trigger, pattern, template, 5, 80, False) for trigger, pattern, template in FACT_RULES]
+)
+_RULES_BY_TRIGGER = {}
+for _index, _rule in enumerate(RULES):
+    _RULES_BY_TRIGGER.setdefault(_rule.trigger, []).append(_index)
+
+
+def clean_text(text: str) -> str:
+    # str.split() and \s agree on what counts as whitespace
+    return _SPECIAL_CHARS.sub('', " ".join(text.split()))
+
+
+def iter_sentences(text: str):
+    """Yield (sentence, terminated); sentences keep their terminator"""
+    end = 0
+    for match in _SENTENCE.finditer(text):
+        end = match.end()
+        yield match.group(0), True
+    if end < len(text):
+        yield text[end:], False
+
+
+def generate_flashcards_fallback(text: str, n_cards: int = 5):
+    """Generate high-quality flashcards from text using advanced text processing"""
+    if n_cards <= 0:
+        return []
+    text = clean_text(text)
+
+    # Candidates per rule, capped at n_cards since no rule can contribute more
+    buckets = [[] for _ in RULES]
+    comparisons, important = [], []
+    complete = True
+
+    for sentence, terminated in iter_sentences(text):
+        if terminated:
+            triggered = {match.lastgroup for match in _TRIGGERS.finditer(sentence)}
+            for trigger in triggered:
+                for index in _RULES_BY_TRIGGER[trigger]:
+                    bucket = buckets[index]
+                    if len(bucket) < n_cards:
+                        for card in RULES[index].cards(sentence):
+                            bucket.append(card)
+                            if len(bucket) >= n_cards:
+                                break
+
+            body = sentence[:-1]
+            if len(comparisons) < n_cards and _COMPARISON.search(body):
+                comparisons.append(body)
+
+        # Keyword sentences are split on runs of terminators, as before
+        for part in _TERMINATORS.split(sentence):
+            part = part.strip()
+            if len(part) > 20 and len(important) < n_cards and _IMPORTANT_WORDS.search(part.lower()):
+                important.append(part)
+
+        if len(buckets[0]) >= n_cards:
+            # The top rule alone fills the deck; nothing later can change it
+            complete = False
+            break
+
+    flashcards = []
+    for bucket in buckets:
+        flashcards.extend(bucket[:n_cards - len(flashcards)])
+        if len(flashcards) >= n_cards or not complete:
+            return flashcards[:n_cards]
+
+    # Numbered items can span a terminator ("1. Step"), so they get their own scan
+    remaining = n_cards - len(flashcards)
+    numbered = []
+    for match in _NUMBERED.finditer(text):
+        numbered.append(match.groups())
+        if len(numbered) >= remaining:
+            break
+    for num, item in numbered:
+        if len(item.strip()) < 10:
+            continue
+        flashcards.append({
+            "question": f"What is step {num} or point {num}?",
+            "answer": item.strip(),
+            "difficulty": "medium"
+        })
+
+    if len(flashcards) < n_cards:
+        for sentence in comparisons[:n_cards - len(flashcards)]:
+            sentence = sentence.strip()
+            if len(sentence) < 20 or len(sentence) > 120:
+                continue
+            flashcards.append({
+                "question": "What is the comparison or difference mentioned?",
+                "answer": sentence,
+                "difficulty": "medium"
+            })
+
+    if len(flashcards) < n_cards:
+        for sentence in important[:n_cards - len(flashcards)]:
+            if len(sentence) > 150:
+                sentence = sentence[:150] + "..."
+            flashcards.append({
+                "question": "What important point is mentioned?",
+                "answer": sentence,
+                "difficulty": "medium"
+            })
+
+    return flashcards[:n_cards]
@@ -0,0 +1,149 @@
+import os
+import re
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from hf_client import generate_flashcards, GENERATION_CONCURRENCY
+from metrics import ERRORS
+
+log = logging.getLogger(__name__)
+
+# Rough token estimate used for budgeting; close enough for English prose
+CHARS_PER_TOKEN = 4
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "100"))
+GENERATION_MAX_CHUNKS = int(os.getenv("GENERATION_MAX_CHUNKS", "24"))
+
+_SENTENCE_END = re.compile(r'[.!?]\s')
+_NOT_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _split_point(buf: str, limit: int) -> int:
+    """Index to cut buf at: last sentence end, else last space, in its second half"""
+    floor = limit // 2
+    ends = [m.end() for m in _SENTENCE_END.finditer(buf, floor, limit)]
+    if ends:
+        return ends[-1]
+    space = buf.rfind(" ", floor, limit)
+    return space + 1 if space != -1 else limit
+
+
+def iter_page_chunks(pages, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Yield (chunk, page numbers) of overlapping, token-budgeted chunks.
+
+    pages is an iterable of (page number, text) consumed lazily, so only about
+    one chunk of text is buffered at a time. Each chunk reports the pages its
+    text came from.
+    """
+    chunk_chars = chunk_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, chunk_chars // 4)
+    buf = ""
+    spans = []  # (start, end, page number) of each page's text within buf
+    carried = 0  # leading chars of buf already emitted as overlap
+
+    for page_no, text in pages:
+        start = len(buf)
+        buf += re.sub(r'\s+', ' ', text)
+        spans.append((start, len(buf), page_no))
+        while len(buf) >= chunk_chars:
+            cut = _split_point(buf, chunk_chars)
+            chunk = buf[:cut].strip()
+            if chunk:
+                yield chunk, [page for s, e, page in spans if s < cut and e > s]
+            start = buf.find(" ", max(0, cut - overlap_chars), cut)
+            start = start + 1 if start != -1 else cut
+            carried = cut - start
+            buf = buf[start:]
+            spans = [(s - start, e - start, page) for s, e, page in spans if e > start]
+
+    if len(buf) > carried and buf.strip():
+        yield buf.strip(), [page for s, e, page in spans if e > s]
+
+
+def iter_chunks(pieces, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Yield overlapping, token-budgeted chunks from an iterable of text pieces"""
+    for chunk, _ in iter_page_chunks(enumerate(pieces), chunk_tokens, overlap_tokens):
+        yield chunk
+
+
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list:
+    return list(iter_chunks([text], chunk_tokens, overlap_tokens))
+
+
+def _spread(items: list, k: int) -> list:
+    """Pick k items evenly spaced across the list, keeping first and last"""
+    if k >= len(items):
+        return list(items)
+    if k == 1:
+        return [items[len(items) // 2]]
+    return [items[round(i * (len(items) - 1) / (k - 1))] for i in range(k)]
+
+
+def _card_key(card: dict) -> str:
+    return _NOT_WORD.sub(" ", card.get("question", "").lower()).strip()
+
+
+def merge_cards(per_chunk: list, n_cards: int, return_sources: bool = False):
+    """Dedupe cards by question and interleave chunks so cards span the document.
+
+    With return_sources, also returns the index into per_chunk each card came from.
+    """
+    seen = set()
+    queues = []
+    for cards in per_chunk:
+        unique = []
+        for card in cards:
+            key = _card_key(card)
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(card)
+        queues.append(unique)
+
+    merged, sources = [], []
+    depth = 0
+    while len(merged) < n_cards and any(len(q) > depth for q in queues):
+        for source, q in enumerate(queues):
+            if len(q) > depth and len(merged) < n_cards:
+                merged.append(q[depth])
+                sources.append(source)
+        depth += 1
+    return (merged, sources) if return_sources else merged
+
+
+def generate_flashcards_chunked(chunks: list, n_cards: int = 5, generator=generate_flashcards,
+                                concurrency: int = GENERATION_CONCURRENCY,
+                                max_chunks: int = GENERATION_MAX_CHUNKS, return_sources: bool = False):
+    """Map-reduce flashcard generation over document chunks.
+
+    generator(text, n_cards) -> list of card dicts is called once per selected
+    chunk, at most `concurrency` at a time. Any callable with that signature
+    works, e.g. generate_flashcards_fallback for offline runs. With
+    return_sources, returns (cards, index into chunks of each card's source).
+    """
+    if not chunks or n_cards <= 0:
+        return ([], []) if return_sources else []
+
+    selected = _spread(list(range(len(chunks))), min(len(chunks), n_cards, max_chunks))
+    # One spare card per chunk leaves room for duplicates dropped in the merge
+    per_chunk_cards = math.ceil(n_cards / len(selected)) + 1
+
+    def run(index):
+        try:
+            return generator(chunks[index], per_chunk_cards)
+        except Exception as e:
+            log.warning("Chunk generation failed", extra={"chunk": index, "error": str(e)})
+            ERRORS.inc(component="generation.chunk")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        per_chunk = list(pool.map(run, selected))
+
+    if not return_sources:
+        return merge_cards(per_chunk, n_cards)
+    cards, sources = merge_cards(per_chunk, n_cards, return_sources=True)
+    return cards, [selected[source] for source in sources]
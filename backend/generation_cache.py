@@ -0,0 +1,119 @@
+import os
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+HIT = "hit"
+SHARED = "shared"
+MISS = "miss"
+
+
+def generation_key(digest: str, n_cards: int, model: str) -> str:
+    """Cache key for an upload: its SHA-256 plus everything that shapes the output"""
+    return hashlib.sha256(f"{digest}\0{n_cards}\0{model}".encode()).hexdigest()
+
+
+def estimate_size(value: dict) -> int:
+    size = sum(len(chunk) for chunk in value.get("chunks", []))
+    size += sum(len(card.get("question", "")) + len(card.get("answer", "")) + 200
+                for card in value.get("flashcards", []))
+    size += sum(32 * len(emb) for emb in value.get("embeddings", []))
+    return size
+
+
+class GenerationCache:
+    """Size-bounded LRU of upload results with single-flight deduplication.
+
+    Concurrent requests for the same key share one computation: the first
+    caller runs it and the rest wait on its Future.
+    """
+
+    def __init__(self, max_bytes: int = GENERATION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.inflight = {}
+        self.total_bytes = 0
+        self.counts = {HIT: 0, SHARED: 0, MISS: 0}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute, cacheable=None):
+        """Return (value, outcome) where outcome is "hit", "shared" or "miss".
+
+        The value is a deep copy, so callers may modify it freely. When
+        cacheable(value) is false the value is shared with concurrent callers
+        but not stored.
+        """
+        value, outcome = self.claim(key)
+        if outcome != MISS:
+            return value, outcome
+        try:
+            value = compute()
+        except BaseException as e:
+            self.abandon(key, e)
+            raise
+        self.resolve(key, value, cacheable is None or cacheable(value))
+        return copy.deepcopy(value), MISS
+
+    def claim(self, key: str):
+        """Look up key, taking over its computation when it is neither cached nor in flight.
+
+        Returns (value, outcome) like get_or_compute, waiting for a computation
+        already in flight. On a miss the value is None and the caller must
+        finish with resolve() or abandon(), which releases anyone waiting.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.counts[HIT] += 1
+                return copy.deepcopy(entry[0]), HIT
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                self.inflight[key] = Future()
+            self.counts[MISS if owner else SHARED] += 1
+
+        if owner:
+            return None, MISS
+        return copy.deepcopy(future.result()), SHARED
+
+    def resolve(self, key: str, value: dict, cacheable: bool = True):
+        """Hand a claimed key's value to its waiters, caching it when cacheable; keeps value, not a copy"""
+        with self._lock:
+            future = self.inflight.pop(key)
+            if cacheable:
+                self._store(key, value)
+        future.set_result(value)
+
+    def abandon(self, key: str, error: BaseException):
+        """Give up a claimed key; its waiters get error"""
+        with self._lock:
+            future = self.inflight.pop(key)
+        future.set_exception(error)
+
+    def _store(self, key: str, value: dict):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "inflight": len(self.inflight),
+                **self.counts,
+            }
+
+
+generation_cache = GenerationCache()
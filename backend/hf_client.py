@@ -1,171 +1,67 @@
 import os, json, re
-import hashlib
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from embedding_cache import EmbeddingCache, cache_key, normalize_text
+from providers import registry, EMBEDDING_MODEL
+from resilience import CircuitBreaker
+from local_embeddings import local_embedder, LOCAL_EMBEDDING_MODEL
+from metrics import FALLBACKS, provider_call
+from jobs import JOB_WORKERS
+from fallback_rules import generate_flashcards_fallback
+
+log = logging.getLogger(__name__)
 
 HF_TOKEN = os.getenv("HF_API_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Longest text sent in one Gemini prompt; chunked generation stays under it
+GEMINI_MAX_INPUT_CHARS = int(os.getenv("GEMINI_MAX_INPUT_CHARS", "4000"))
 
-# Advanced flashcard generation without AI
-def generate_flashcards_fallback(text: str, n_cards: int = 5):
-    """Generate high-quality flashcards from text using advanced text processing"""
-    import re
-    
-    # Clean and normalize text
-    text = re.sub(r'\s+', ' ', text.strip())
-    text = re.sub(r'[^\w\s.,!?;:()\-]', '', text)  # Remove special chars except basic punctuation
-    
-    flashcards = []
-    
-    # 1. Extract definitions and explanations
-    definition_patterns = [
-        # "X is Y" patterns
-        (r'([A-Z][a-zA-Z\s]{2,30})\s+is\s+([^.!?]{10,80})[.!?]', "What is {}?"),
-        (r'([A-Z][a-zA-Z\s]{2,30})\s+means\s+([^.!?]{10,80})[.!?]', "What does {} mean?"),
-        (r'([A-Z][a-zA-Z\s]{2,30})\s+refers to\s+([^.!?]{10,80})[.!?]', "What does {} refer to?"),
-        
-        # "A X is Y" patterns  
-        (r'A\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is a {}?"),
-        (r'An\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is an {}?"),
-        (r'The\s+([a-zA-Z\s]{3,25})\s+is\s+([^.!?]{10,80})[.!?]', "What is the {}?"),
-        
-        # "X can be defined as Y" patterns
-        (r'([A-Z][a-zA-Z\s]{2,30})\s+can be defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
-        (r'([A-Z][a-zA-Z\s]{2,30})\s+is defined as\s+([^.!?]{10,80})[.!?]', "How is {} defined?"),
-    ]
-    
-    for pattern, question_template in definition_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            if len(flashcards) >= n_cards:
-                break
-                
-            term = match.group(1).strip()
-            definition = match.group(2).strip()
-            
-            # Clean up term and definition
-            term = re.sub(r'\s+', ' ', term)
-            definition = re.sub(r'\s+', ' ', definition)
-            
-            # Skip if too short or too long
-            if len(term) < 3 or len(term) > 40 or len(definition) < 8 or len(definition) > 100:
-                continue
-                
-            # Skip if definition contains question words (likely not a definition)
-            if any(word in definition.lower() for word in ['what', 'how', 'why', 'when', 'where', 'which']):
-                continue
-                
-            question = question_template.format(term.lower())
-            
-            flashcards.append({
-                "question": question,
-                "answer": definition,
-                "difficulty": "medium"
-            })
-    
-    # 2. Extract key facts and relationships
-    if len(flashcards) < n_cards:
-        fact_patterns = [
-            # "X has Y" patterns
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+has\s+([^.!?]{5,60})[.!?]', "What does {} have?"),
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+contains\s+([^.!?]{5,60})[.!?]', "What does {} contain?"),
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+includes\s+([^.!?]{5,60})[.!?]', "What does {} include?"),
-            
-            # "X does Y" patterns
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+performs\s+([^.!?]{5,60})[.!?]', "What does {} perform?"),
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+provides\s+([^.!?]{5,60})[.!?]', "What does {} provide?"),
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+ensures\s+([^.!?]{5,60})[.!?]', "What does {} ensure?"),
-            
-            # "X are Y" patterns
-            (r'([A-Z][a-zA-Z\s]{2,30})\s+are\s+([^.!?]{5,60})[.!?]', "What are {}?"),
-        ]
-        
-        for pattern, question_template in fact_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if len(flashcards) >= n_cards:
-                    break
-                    
-                subject = match.group(1).strip()
-                fact = match.group(2).strip()
-                
-                # Clean up
-                subject = re.sub(r'\s+', ' ', subject)
-                fact = re.sub(r'\s+', ' ', fact)
-                
-                if len(subject) < 3 or len(subject) > 40 or len(fact) < 5 or len(fact) > 80:
-                    continue
-                    
-                question = question_template.format(subject.lower())
-                
-                flashcards.append({
-                    "question": question,
-                    "answer": fact,
-                    "difficulty": "medium"
-                })
-    
-    # 3. Extract numbered lists and steps
-    if len(flashcards) < n_cards:
-        # Look for numbered items
-        numbered_items = re.findall(r'(\d+)[.)]\s*([^.!?]{10,100})[.!?]', text)
-        
-        for i, (num, item) in enumerate(numbered_items[:n_cards - len(flashcards)]):
-            if len(item.strip()) < 10:
-                continue
-                
-            question = f"What is step {num} or point {num}?"
-            answer = item.strip()
-            
-            flashcards.append({
-                "question": question,
-                "answer": answer,
-                "difficulty": "medium"
-            })
-    
-    # 4. Create comparison questions
-    if len(flashcards) < n_cards:
-        # Look for comparison words
-        comparison_sentences = re.findall(r'([^.!?]*(?:different|similar|compare|contrast|versus|vs)[^.!?]*)[.!?]', text, re.IGNORECASE)
-        
-        for sentence in comparison_sentences[:n_cards - len(flashcards)]:
-            sentence = sentence.strip()
-            if len(sentence) < 20 or len(sentence) > 120:
-                continue
-                
-            question = "What is the comparison or difference mentioned?"
-            answer = sentence
-            
-            flashcards.append({
-                "question": question,
-                "answer": answer,
-                "difficulty": "medium"
-            })
-    
-    # 5. Fallback: Create questions from important sentences
-    if len(flashcards) < n_cards:
-        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if len(s.strip()) > 20]
-        
-        # Filter for sentences with important keywords
-        important_sentences = []
-        keywords = ['important', 'key', 'main', 'primary', 'essential', 'significant', 
-                   'must', 'should', 'required', 'necessary', 'critical', 'fundamental']
-        
-        for sentence in sentences:
-            if any(keyword in sentence.lower() for keyword in keywords):
-                important_sentences.append(sentence)
-        
-        for sentence in important_sentences[:n_cards - len(flashcards)]:
-            if len(sentence) > 150:
-                sentence = sentence[:150] + "..."
-                
-            question = "What important point is mentioned?"
-            answer = sentence
-            
-            flashcards.append({
-                "question": question,
-                "answer": answer,
-                "difficulty": "medium"
-            })
-    
-    return flashcards[:n_cards]
+# Latency budget for one remote generation call, in seconds
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "20"))
+# Run the local fallback alongside every remote call
+GENERATION_HEDGE = os.getenv("GENERATION_HEDGE", "false").lower() in ("1", "true", "yes")
+# Chunk calls one document's generation makes at once
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+# Documents a batch upload generates at once
+BATCH_GENERATE_WORKERS = int(os.getenv("BATCH_GENERATE_WORKERS", "2"))
+# Enough workers for every chunk call that single and batch uploads can make at once
+GENERATION_REMOTE_WORKERS = int(os.getenv("GENERATION_REMOTE_WORKERS",
+                                          str((JOB_WORKERS + BATCH_GENERATE_WORKERS) * GENERATION_CONCURRENCY)))
+
+registry.configure(gemini_api_key=GEMINI_API_KEY, hf_token=HF_TOKEN)
+gemini_breaker = CircuitBreaker("gemini")
+# Remote calls run here so the caller can stop waiting at the deadline
+_remote_pool = ThreadPoolExecutor(max_workers=GENERATION_REMOTE_WORKERS, thread_name_prefix="gemini")
+# Deadline of each call holding a pool worker; a call keeps its worker until it
+# really returns, even past its deadline
+_remote_calls = {}
+_remote_slots = threading.Condition()
+
+def _acquire_remote_slot(deadline: float):
+    """Wait until deadline for a free pool worker; returns a token for _release_remote_slot, or None.
+
+    Gives up at once when every worker is held by a call already past its
+    deadline, since those may not return for a long time.
+    """
+    token = object()
+    with _remote_slots:
+        while len(_remote_calls) >= GENERATION_REMOTE_WORKERS:
+            now = time.monotonic()
+            live = [held for held in _remote_calls.values() if held > now]
+            if not live or now >= deadline:
+                return None
+            # Wake by the time the remaining live calls have all overrun, too
+            _remote_slots.wait(min(deadline, max(live)) - now)
+        _remote_calls[token] = deadline
+    return token
+
+def _release_remote_slot(token):
+    with _remote_slots:
+        _remote_calls.pop(token, None)
+        _remote_slots.notify()
 
 def clean_flashcard(card):
     """Clean up flashcard to ensure proper length and format"""
@@ -194,26 +90,7 @@ def clean_flashcard(card):
 def generate_flashcards_with_gemini(text: str, n_cards: int = 5):
     """Generate high-quality flashcards using Google Gemini API"""
     try:
-        import google.generativeai as genai
-        
-        # Configure Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Try different model names
-        model_names = ['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro', 'models/gemini-1.5-flash']
-        
-        model = None
-        for model_name in model_names:
-            try:
-                model = genai.GenerativeModel(model_name)
-                print(f"✅ Using Gemini model: {model_name}")
-                break
-            except Exception as e:
-                print(f"❌ Model {model_name} failed: {e}")
-                continue
-        
-        if not model:
-            raise Exception("No valid Gemini model found")
+        model = registry.gemini_model()
         
         prompt = f"""
         Create {n_cards} high-quality flashcards from the following text. 
@@ -234,15 +111,14 @@ def generate_flashcards_with_gemini(text: str, n_cards: int = 5):
         ]
 
         TEXT TO PROCESS:
-        {text[:4000]}
+        {text[:GEMINI_MAX_INPUT_CHARS]}
 
         Generate exactly {n_cards} flashcards as a JSON array:
         """
         
-        print("🚀 Making Gemini API call...")
-        response = model.generate_content(prompt)
-        
-        print(f"📥 Gemini response: {response.text[:300]}...")
+        with provider_call("gemini"):
+            response = model.generate_content(prompt)
+        log.debug("Gemini response", extra={"chars": len(response.text)})
         
         # Extract JSON from response
         json_match = re.search(r'\[[\s\S]*\]', response.text)
@@ -266,59 +142,156 @@ def generate_flashcards_with_gemini(text: str, n_cards: int = 5):
                         "difficulty": "medium"
                     })
         
-        print(f"✅ Gemini API success! Generated {len(valid_cards)} valid cards")
+        log.debug("Gemini generation succeeded", extra={"cards": len(valid_cards)})
+        registry.report_success()
         return valid_cards[:n_cards]
         
     except Exception as e:
-        print(f"❌ Gemini API failed: {e}")
+        registry.report_failure(e)
         raise
 
-def generate_flashcards(text: str, n_cards: int = 5):
-    """Generate flashcards - try Gemini first, then fallback"""
-    print(f"=== FLASHCARD GENERATION DEBUG ===")
-    print(f"GEMINI_API_KEY present: {bool(GEMINI_API_KEY)}")
-    print(f"HF_TOKEN present: {bool(HF_TOKEN)}")
-    print(f"Text length: {len(text)}")
-    print(f"Requested cards: {n_cards}")
-    
+def generate_flashcards_with_provider(text: str, n_cards: int = 5, remote=None, timeout: float = None,
+                                      hedge: bool = None, breaker: CircuitBreaker = None):
+    """Generate flashcards - try Gemini first, then fallback.
+
+    Returns (cards, provider), where provider is "gemini" or "local" for
+    the local rule engine. The remote call gets `timeout` seconds, including any wait for a free
+    remote worker. It is skipped while the circuit breaker is open, or while
+    every remote worker is held by calls that outlived their deadline.
+    With hedge, the local fallback runs while the remote call is in flight,
+    so a failed or late remote result costs no extra time. remote and
+    breaker default to Gemini and its breaker; tests can pass a fake
+    provider instead.
+    """
+    remote = remote or (generate_flashcards_with_gemini if GEMINI_API_KEY else None)
+    timeout = GENERATION_TIMEOUT if timeout is None else timeout
+    hedge = GENERATION_HEDGE if hedge is None else hedge
+    breaker = breaker or gemini_breaker
+
+    log.debug("Generating flashcards", extra={"chars": len(text), "n_cards": n_cards, "remote": bool(remote)})
+
     # Try Gemini API first (best quality)
-    if GEMINI_API_KEY:
+    hedged = None
+    deadline = time.monotonic() + timeout
+    slot = _acquire_remote_slot(deadline) if remote else None
+    if slot and breaker.allow():
         try:
-            print("🌟 Trying Gemini API...")
-            cards = generate_flashcards_with_gemini(text, n_cards)
-            return [clean_flashcard(card) for card in cards]
+            future = _remote_pool.submit(remote, text, n_cards)
+        except BaseException:
+            _release_remote_slot(slot)
+            raise
+        future.add_done_callback(lambda _: _release_remote_slot(slot))
+        if hedge:
+            hedged = generate_flashcards_fallback(text, n_cards)
+        try:
+            cards = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            if not cards:
+                raise ValueError("Gemini returned no valid cards")
+            breaker.record_success()
+            return [clean_flashcard(card) for card in cards], "gemini"
+        except FutureTimeout:
+            log.warning("Gemini timed out, using local fallback", extra={"timeout": timeout})
+            FALLBACKS.inc(kind="generation", reason="timeout")
+            breaker.record_failure()
         except Exception as e:
-            print(f"❌ Gemini API failed: {e}")
-    
+            log.warning("Gemini failed, using local fallback", extra={"error": str(e)})
+            FALLBACKS.inc(kind="generation", reason="error")
+            breaker.record_failure()
+    elif slot:
+        _release_remote_slot(slot)
+        log.debug("Gemini circuit open, skipping remote call")
+        FALLBACKS.inc(kind="generation", reason="circuit_open")
+    elif remote:
+        log.warning("No Gemini worker free before the deadline, using local fallback",
+                    extra={"workers": GENERATION_REMOTE_WORKERS})
+        FALLBACKS.inc(kind="generation", reason="saturated")
+    else:
+        FALLBACKS.inc(kind="generation", reason="no_provider")
+
+    if hedged:
+        return [clean_flashcard(card) for card in hedged], "local"
+
     # Fallback to local method
-    print("🔄 Using local fallback method...")
     cards = generate_flashcards_fallback(text, n_cards)
-    print(f"✅ Local fallback success! Generated {len(cards)} cards")
-    return [clean_flashcard(card) for card in cards]
+    return [clean_flashcard(card) for card in cards], "local"
 
-def get_embedding(text: str):
-    """Generate embedding - fallback to hash if HF fails"""
+def generate_flashcards(text: str, n_cards: int = 5, remote=None, timeout: float = None,
+                        hedge: bool = None, breaker: CircuitBreaker = None):
+    """Generate flashcards, without saying which provider produced them"""
+    return generate_flashcards_with_provider(text, n_cards, remote, timeout, hedge, breaker)[0]
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+embedding_cache = EmbeddingCache()
+
+def get_embed_client():
+    """Return the shared Hugging Face client from the provider registry"""
+    return registry.embed_client()
+
+def _as_list(vec):
+    return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+
+def _embed_batch(client, batch: list):
+    """Embed a batch in one request, falling back to one request per text"""
     try:
-        if not HF_TOKEN:
-            # Simple hash-based embedding
-            hash_obj = hashlib.md5(text.encode())
-            hash_hex = hash_obj.hexdigest()
-            embedding = [int(hash_hex[i:i+2], 16) / 255.0 for i in range(0, len(hash_hex), 2)]
-            return embedding
-        
-        from huggingface_hub import InferenceClient
-        embed_client = InferenceClient(
-            model="sentence-transformers/all-MiniLM-L6-v2",
-            token=HF_TOKEN,
-        )
-        
-        vec = embed_client.feature_extraction(text.replace("\n", " "))
-        return vec
-        
+        with provider_call("huggingface"):
+            vectors = client.feature_extraction(batch)
+        if len(vectors) == len(batch):
+            return [_as_list(vec) for vec in vectors]
     except Exception as e:
-        print(f"Embedding failed: {e}, using hash fallback")
-        # Simple hash-based embedding fallback
-        hash_obj = hashlib.md5(text.encode())
-        hash_hex = hash_obj.hexdigest()
-        embedding = [int(hash_hex[i:i+2], 16) / 255.0 for i in range(0, len(hash_hex), 2)]
-        return embedding 
+        log.warning("Batch embedding failed, retrying per text", extra={"texts": len(batch), "error": str(e)})
+    vectors = []
+    for text in batch:
+        with provider_call("huggingface"):
+            vectors.append(_as_list(client.feature_extraction(text)))
+    return vectors
+
+def embed_texts(texts: list, batch_size: int = EMBEDDING_BATCH_SIZE):
+    """Embed many texts, serving repeats from the cache and batching the rest.
+
+    Returns (vectors, models), naming the model behind each vector. Texts the
+    remote model could not embed get local vectors, which live in a
+    different space of the same size, so they must only be compared with
+    vectors of the same model.
+    """
+    if not HF_TOKEN:
+        FALLBACKS.inc(kind="embedding", reason="no_provider")
+        return local_embedder.embed(texts).tolist(), [LOCAL_EMBEDDING_MODEL] * len(texts)
+
+    normalized = [normalize_text(text) for text in texts]
+    keys = [cache_key(EMBEDDING_MODEL, text) for text in normalized]
+    vectors = embedding_cache.get_many(keys)
+
+    pending = {}
+    for key, text in zip(keys, normalized):
+        if key not in vectors:
+            pending.setdefault(key, text)
+
+    if pending:
+        pending_keys = list(pending)
+        try:
+            client = get_embed_client()
+            for i in range(0, len(pending_keys), batch_size):
+                batch_keys = pending_keys[i:i + batch_size]
+                batch = _embed_batch(client, [pending[key] for key in batch_keys])
+                fresh = dict(zip(batch_keys, batch))
+                embedding_cache.put_many(fresh)
+                vectors.update(fresh)
+        except Exception as e:
+            log.warning("Embedding failed, using local embeddings", extra={"error": str(e)})
+            FALLBACKS.inc(kind="embedding", reason="error")
+
+    missing = [i for i, key in enumerate(keys) if key not in vectors]
+    local = dict(zip(missing, local_embedder.embed([texts[i] for i in missing]).tolist())) if missing else {}
+    return (
+        [vectors[key] if key in vectors else local[i] for i, key in enumerate(keys)],
+        [EMBEDDING_MODEL if key in vectors else LOCAL_EMBEDDING_MODEL for key in keys],
+    )
+
+def get_embeddings(texts: list, batch_size: int = EMBEDDING_BATCH_SIZE):
+    """Embed many texts, without saying which model produced each vector"""
+    return embed_texts(texts, batch_size)[0]
+
+def get_embedding(text: str):
+    """Generate embedding - fallback to local embeddings if HF fails"""
+    return get_embeddings([text])[0]
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import tempfile
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+# Room in a request body for multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """Rejects upload request bodies over a per-path limit before they are parsed.
+
+    FastAPI parses a multipart form, writing its files to disk, before the
+    handler runs, so spool_upload's limit alone only applies once the whole
+    body has arrived. A declared Content-Length over the limit is answered
+    with 413 straight away; bodies without one are counted as they are
+    received and cut off as soon as they pass it.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path -> most bytes of file content a request may carry
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_body = limit + MULTIPART_OVERHEAD_BYTES
+        detail = f"Upload exceeds the {limit} byte limit"
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > max_body:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    raise HTTPException(413, detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                       chunk_size: int = UPLOAD_CHUNK_BYTES):
+    """Stream an upload to a temp file chunk by chunk.
+
+    Returns (path, sha256 hex digest of the content); the digest is computed
+    on the fly and identifies repeat uploads of the same file.
+
+    The size limit is enforced while streaming, so an oversized upload is
+    rejected without ever being held in memory; UploadLimitMiddleware has
+    already turned away request bodies that could not fit. The caller owns
+    the returned file and must remove it with discard_upload().
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="upload-", dir=UPLOAD_TMP_DIR)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(413, f"File exceeds the {max_bytes} byte upload limit")
+                digest.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+    except BaseException:
+        discard_upload(path)
+        raise
+    finally:
+        await file.close()
+
+    if size == 0:
+        discard_upload(path)
+        raise HTTPException(400, "Uploaded file is empty")
+    return path, digest.hexdigest()
+
+
+def discard_upload(path: str):
+    """Remove a spooled upload, ignoring files that are already gone"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
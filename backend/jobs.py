@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import STAGE_SECONDS, JOBS
+
+log = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+MAX_JOBS = int(os.getenv("MAX_JOBS", "1000"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class Job:
+    """State of one background job, safe to read from request handlers"""
+
+    def __init__(self, kind: str, stages: list):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.stages = list(stages)
+        self.status = QUEUED
+        self.stage = None
+        self.completed_stages = []
+        # Set by jobs that work through several items, e.g. the files of a batch
+        self.items_done = 0
+        self.items_total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    def start_stage(self, name: str):
+        """Mark the start of a pipeline stage, closing the previous one and timing it"""
+        now = time.perf_counter()
+        with self._lock:
+            if self.stage and self.stage not in self.completed_stages:
+                self.completed_stages.append(self.stage)
+                STAGE_SECONDS.observe(now - self._stage_started, stage=self.stage)
+            self.stage = name
+            self._stage_started = now
+
+    def set_items(self, done: int, total: int):
+        with self._lock:
+            self.items_done = done
+            self.items_total = total
+
+    def progress(self) -> float:
+        if self.status == COMPLETED:
+            return 1.0
+        if self.items_total:
+            return round(self.items_done / self.items_total, 2)
+        if not self.stages:
+            return 0.0
+        return round(len(self.completed_stages) / len(self.stages), 2)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "stages": self.stages,
+                "progress": self.progress(),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.items_total is not None:
+                data["items"] = {"done": self.items_done, "total": self.items_total}
+            if self.status == COMPLETED:
+                data["result"] = self.result
+            if self.status == FAILED:
+                data["error"] = self.error
+            return data
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their state in memory"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, ttl: int = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, stages: list, fn, *args, **kwargs) -> Job:
+        """Queue fn(job, *args, **kwargs); its return value becomes the job result"""
+        job = Job(kind, stages)
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+            job.start_stage(None)
+            job.result = result
+            job.status = COMPLETED
+        except Exception as e:
+            log.exception("Job failed", extra={"job_id": job.id, "kind": job.kind, "stage": job.stage})
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            JOBS.inc(kind=job.kind, status=job.status)
+
+    def _prune(self):
+        """Drop finished jobs past their TTL, then the oldest ones over the cap"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+        if len(self.jobs) >= self.max_jobs:
+            finished = sorted(
+                (job for job in self.jobs.values() if job.finished_at),
+                key=lambda job: job.finished_at,
+            )
+            for job in finished[:len(self.jobs) - self.max_jobs + 1]:
+                del self.jobs[job.id]
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+
+job_manager = JobManager()
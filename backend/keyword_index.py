@@ -0,0 +1,159 @@
+import re
+import math
+import heapq
+from bisect import bisect_left, insort
+
+import db
+from lazy_index import LazyUserIndex
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Cap on vocabulary terms a single prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+class _UserIndex:
+    """Inverted index over one user's cards"""
+
+    def __init__(self):
+        self.postings = {}  # term -> {card id: term frequency}
+        self.terms = []  # sorted vocabulary, for prefix lookups
+        self.doc_terms = {}  # card id -> {term: tf}, needed to undo a card on update/delete
+        self.doc_len = {}
+        self.total_len = 0
+        self.cards = {}
+        # Score bounds for pruning; they only loosen on removal, so stay valid without rescans
+        self.max_tf = {}  # term -> highest tf the term has had in a card
+        self.min_len = None  # shortest card seen
+
+    def add(self, row: dict):
+        card_id = row["id"]
+        card = {key: value for key, value in row.items() if key != "embedding"}
+        card = {**self.cards.get(card_id, {}), **card}
+        self.remove(card_id)
+        self.cards[card_id] = card
+
+        tokens = tokenize(f"{card.get('question', '')} {card.get('answer', '')}")
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                insort(self.terms, term)
+            posting[card_id] = tf
+            self.max_tf[term] = max(self.max_tf.get(term, 0), tf)
+        self.doc_terms[card_id] = counts
+        self.min_len = len(tokens) if self.min_len is None else min(self.min_len, len(tokens))
+        self.doc_len[card_id] = len(tokens)
+        self.total_len += len(tokens)
+
+    def remove(self, card_id):
+        counts = self.doc_terms.pop(card_id, None)
+        self.cards.pop(card_id, None)
+        if counts is None:
+            return
+        for term in counts:
+            posting = self.postings[term]
+            del posting[card_id]
+            if not posting:
+                del self.postings[term]
+                del self.max_tf[term]
+                del self.terms[bisect_left(self.terms, term)]
+        self.total_len -= self.doc_len.pop(card_id)
+
+    def expand(self, term: str, prefix: bool) -> list:
+        if not prefix:
+            return [term] if term in self.postings else []
+        start = bisect_left(self.terms, term)
+        matches = []
+        for candidate in self.terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, query: str, k: int, prefix: bool):
+        """Top k (card id, score) pairs, pruned MaxScore-style.
+
+        Terms are scored rarest first. Each term's most possible addition to
+        a card follows from its highest tf and the shortest card, so once the
+        terms still to come could not lift a card past the current k-th score,
+        they only add to the scored cards that can still make the top k
+        instead of walking their whole (long) postings.
+        """
+        n_docs = len(self.doc_len)
+        if not n_docs or k <= 0:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        weights = {}
+        for query_term in set(tokenize(query)):
+            for term in self.expand(query_term, prefix):
+                posting = self.postings[term]
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                # Prefix expansions count for less than an exact match
+                weights[term] = weights.get(term, 0.0) + (idf if term == query_term else idf * 0.5)
+
+        min_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.min_len / avg_len)
+        order = sorted(weights, key=weights.get, reverse=True)
+        # bounds[i]: the most terms i onwards can add to one card
+        bounds = [0.0] * (len(order) + 1)
+        for i in range(len(order) - 1, -1, -1):
+            max_tf = self.max_tf[order[i]]
+            bounds[i] = bounds[i + 1] + weights[order[i]] * max_tf * (BM25_K1 + 1) / (max_tf + min_norm)
+
+        scores = {}
+        for i, term in enumerate(order):
+            posting, weight = self.postings[term], weights[term]
+            threshold = heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+            if bounds[i] < threshold:
+                # Cards outside the top k that the remaining terms cannot lift in are left with partial scores
+                candidates = [(card_id, posting[card_id]) for card_id, score in scores.items()
+                              if score + bounds[i] >= threshold and card_id in posting]
+            else:
+                candidates = posting.items()
+            for card_id, tf in candidates:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[card_id] / avg_len)
+                scores[card_id] = scores.get(card_id, 0.0) + weight * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class KeywordIndex(LazyUserIndex):
+    """Per-user BM25 index over card questions and answers.
+
+    Like the vector index, a deck is loaded on first search and then kept in
+    sync from db write notifications. Query cost depends on the postings of
+    the query's rarer terms, not on the size of the deck's text.
+    """
+
+    def _build(self, rows: list) -> _UserIndex:
+        index = _UserIndex()
+        self._apply(index, "insert", rows)
+        return index
+
+    def _apply(self, index: _UserIndex, event: str, rows: list):
+        for row in rows:
+            if row.get("id") is None:
+                continue
+            if event == "delete":
+                index.remove(row["id"])
+            else:
+                index.add(row)
+
+    def search(self, user_id: str, query: str, k: int = 10, prefix: bool = True):
+        """Return up to k cards ranked by BM25, each with its score"""
+        index = self._get(user_id)
+        with self._lock:
+            hits = index.search(query, k, prefix)
+            return [{**index.cards[card_id], "score": score} for card_id, score in hits]
+
+
+keyword_index = KeywordIndex()
+db.subscribe(keyword_index.on_write)
@@ -0,0 +1,93 @@
+import threading
+
+import db
+
+
+class _Loading:
+    """A deck fetch in flight for one user, with the writes notified meanwhile"""
+
+    def __init__(self):
+        self.writes = []
+        self.done = threading.Event()
+
+
+class LazyUserIndex:
+    """Per-user state built from a user's deck on first use, then kept in sync from db writes.
+
+    The deck is fetched without holding the lock, so a slow store only
+    stalls callers for the user being loaded. Writes notified while the
+    fetch is in flight are replayed onto the new state, and a failed fetch
+    raises rather than caching an empty deck. Subclasses implement _build
+    and _apply, and read the state returned by _get under self._lock.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def _build(self, rows: list):
+        """Fresh state for a user from their stored cards"""
+        raise NotImplementedError
+
+    def _apply(self, state, event: str, rows: list):
+        """Bring state up to date with an insert, update or delete of rows"""
+        raise NotImplementedError
+
+    def _get(self, user_id: str):
+        """The user's state, loaded first if needed; raises when the deck cannot be fetched"""
+        while True:
+            with self._lock:
+                state = self.users.get(user_id)
+                if state is not None:
+                    return state
+                loading = self._loading.get(user_id)
+                if loading is None:
+                    loading = self._loading[user_id] = _Loading()
+                    break
+            # Another caller is fetching this deck; share its result, or retry if it failed
+            loading.done.wait()
+        return self._load(user_id, loading)
+
+    def _refresh(self, user_id: str):
+        """Rebuild the user's state from a fresh fetch; raises, keeping the old state, when the fetch fails"""
+        with self._lock:
+            loading = self._loading[user_id] = _Loading()
+        return self._load(user_id, loading)
+
+    def _load(self, user_id: str, loading: _Loading):
+        try:
+            state = self._build(db.load_flashcards(user_id))
+        except BaseException:
+            with self._lock:
+                if self._loading.get(user_id) is loading:
+                    del self._loading[user_id]
+            loading.done.set()
+            raise
+        with self._lock:
+            for event, rows in loading.writes:
+                self._apply(state, event, rows)
+            # Not cached if invalidate() ran during the fetch
+            if self._loading.get(user_id) is loading:
+                del self._loading[user_id]
+                self.users[user_id] = state
+        loading.done.set()
+        return state
+
+    def on_write(self, event: str, user_id: str, rows: list):
+        with self._lock:
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                loading.writes.append((event, rows))
+            state = self.users.get(user_id)
+            if state is not None:
+                self._apply(state, event, rows)
+
+    def invalidate(self, user_id: str = None):
+        with self._lock:
+            if user_id is None:
+                self.users.clear()
+                self._loading.clear()
+            else:
+                self.users.pop(user_id, None)
+                self._loading.pop(user_id, None)
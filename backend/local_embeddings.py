@@ -0,0 +1,88 @@
+import os
+import re
+import zlib
+import threading
+
+import numpy as np
+
+# Matches all-MiniLM-L6-v2, so local vectors share the index layout of remote ones
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "384"))
+LOCAL_EMBEDDING_MODEL = f"local-ngram-{LOCAL_EMBEDDING_DIM}"
+CHAR_NGRAM = 3
+# Distinct words whose features are kept hashed; cleared wholesale when full
+FEATURE_CACHE_SIZE = int(os.getenv("LOCAL_EMBEDDING_FEATURE_CACHE", "100000"))
+
+_WORD = re.compile(r"\w+")
+
+
+def _hashed(feature: str, dim: int):
+    """Deterministic bucket and sign for a feature; crc32 is not salted per process like hash()"""
+    h = zlib.crc32(feature.encode())
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+class LocalEmbedder:
+    """Embeds text with signed feature hashing; no network or model download.
+
+    Each text becomes a bag of words, word bigrams and character trigrams
+    of every word, hashed into dim buckets. Character trigrams give
+    morphological variants ("mitochondria", "mitochondrial") overlapping
+    vectors. Rows are L2-normalised, so dot products are cosine scores.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, feature_cache_size: int = FEATURE_CACHE_SIZE):
+        self.dim = dim
+        self.feature_cache_size = feature_cache_size
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _word_features(self, word: str):
+        """(buckets, weights) for a word and its character trigrams, hashed once per word"""
+        features = self._words.get(word)
+        if features is not None:
+            return features
+        padded = f"<{word}>"
+        grams = [padded[i:i + CHAR_NGRAM] for i in range(len(padded) - CHAR_NGRAM + 1)]
+        # The trigrams of a word together weigh as much as the word itself
+        gram_weight = 1.0 / np.sqrt(len(grams))
+        buckets, weights = [], []
+        for feature, weight in [(f"w:{word}", 1.0)] + [(f"c:{gram}", gram_weight) for gram in grams]:
+            bucket, sign = _hashed(feature, self.dim)
+            buckets.append(bucket)
+            weights.append(sign * weight)
+        features = (buckets, weights)
+        with self._lock:
+            if len(self._words) >= self.feature_cache_size:
+                self._words.clear()
+            self._words[word] = features
+        return features
+
+    def embed(self, texts: list) -> np.ndarray:
+        """Embed a batch of texts into an (n, dim) float32 array"""
+        rows, buckets, weights = [], [], []
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            start = len(buckets)
+            for word in words:
+                word_buckets, word_weights = self._word_features(word)
+                buckets.extend(word_buckets)
+                weights.extend(word_weights)
+            for first, second in zip(words, words[1:]):
+                bucket, sign = _hashed(f"b:{first} {second}", self.dim)
+                buckets.append(bucket)
+                weights.append(sign)
+            rows.extend([row] * (len(buckets) - start))
+
+        # One bincount scatters every feature of every text into the batch matrix
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + np.asarray(buckets, dtype=np.int64)
+        matrix = np.bincount(flat, weights=np.asarray(weights, dtype=np.float64),
+                             minlength=len(texts) * self.dim).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix.astype(np.float32)
+
+    def embed_one(self, text: str) -> list:
+        return self.embed([text])[0].tolist()
+
+
+local_embedder = LocalEmbedder()
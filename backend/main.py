@@ -1,16 +1,54 @@
-import os, tempfile
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import os
+import json
+import logging
+from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 # Load environment variables first
 load_dotenv()
 
-from pdf_utils import extract_text_from_pdf
-from hf_client import generate_flashcards, get_embedding
-from db import save_flashcard
+from logging_setup import configure_logging
+configure_logging()
 
-app = FastAPI()
+from admission import upload_admission, estimate_cost, estimate_batch_cost, Overloaded
+from ingest import spool_upload, discard_upload, UploadLimitMiddleware, MAX_UPLOAD_BYTES
+from jobs import job_manager
+from pdf_utils import shutdown_pool
+from pipeline import process_pdf, UPLOAD_STAGES
+from batch_pipeline import process_pdf_batch, BATCH_STAGES, BATCH_MAX_FILES
+from write_buffer import write_buffer
+import search
+from stats import stats_tracker
+from providers import registry
+from metrics import metrics, STAGE_SECONDS, ERRORS
+
+log = logging.getLogger(__name__)
+
+MAX_CARDS_PER_UPLOAD = int(os.getenv("MAX_CARDS_PER_UPLOAD", "50"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resolve the Gemini model and warm provider clients before serving traffic
+    await run_in_threadpool(registry.start)
+    stats_tracker.start_reconciler()
+    yield
+    stats_tracker.stop_reconciler()
+    job_manager.shutdown(wait=False)
+    shutdown_pool()
+    if write_buffer:
+        write_buffer.close()
+
+app = FastAPI(lifespan=lifespan)
+# Added before CORS so its 413s still carry CORS headers
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/upload-pdf/": MAX_UPLOAD_BYTES,
+    "/upload-pdfs/": BATCH_MAX_FILES * MAX_UPLOAD_BYTES,
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -29,7 +67,7 @@ def root():
         "status": "QuickPrep backend (HF edition) online",
         "message": "Backend is running on Render",
         "cors_enabled": True,
-        "endpoints": ["/", "/test-gemini", "/test-hf", "/upload-pdf", "/flashcards", "/search-flashcards"]
+        "endpoints": ["/", "/test-gemini", "/test-hf", "/upload-pdf", "/upload-pdfs", "/jobs/{job_id}", "/flashcards", "/search-flashcards", "/admission/stats", "/metrics"]
     }
 
 @app.get("/test-gemini")
@@ -40,29 +78,18 @@ async def test_gemini():
         if not GEMINI_API_KEY:
             return {"status": "error", "message": "No Gemini API key found"}
         
-        import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Try different model names
-        model_names = ['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro']
-        
-        model = None
-        for model_name in model_names:
-            try:
-                model = genai.GenerativeModel(model_name)
-                break
-            except:
-                continue
-        
-        if not model:
+        try:
+            model = registry.gemini_model()
+        except RuntimeError:
             return {"status": "error", "message": "No valid Gemini model found"}
         
         # Simple test
-        response = model.generate_content("Create 1 flashcard about mathematics. Return as JSON: [{\"question\": \"...\", \"answer\": \"...\"}]")
+        response = await run_in_threadpool(model.generate_content, "Create 1 flashcard about mathematics. Return as JSON: [{\"question\": \"...\", \"answer\": \"...\"}]")
         
         return {
             "status": "success", 
             "message": "Gemini API working",
+            "model": registry.gemini["model"],
             "test_response": response.text[:200] + "..." if len(response.text) > 200 else response.text
         }
         
@@ -73,77 +100,163 @@ async def test_gemini():
             "error_type": type(e).__name__
         }
 
-@app.post("/upload-pdf/")
-async def upload_pdf(file: UploadFile = File(...)):
+@app.post("/upload-pdf/", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), n_cards: int = Form(5, ge=1, le=MAX_CARDS_PER_UPLOAD)):
+    """Accept a PDF and queue it for flashcard generation; poll /jobs/{job_id}"""
     try:
         if file.content_type != "application/pdf":
             raise HTTPException(400, "Upload a PDF")
 
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            tmp.write(await file.read())
-            path = tmp.name
-
-        text = extract_text_from_pdf(path)
-        if not text.strip():
-            raise HTTPException(400, "Could not extract text")
-
-        flashcards = generate_flashcards(text)
-        if not flashcards:
-            raise HTTPException(500, "Flashcard generation failed")
+        with STAGE_SECONDS.time(stage="spool"):
+            path, digest = await spool_upload(file)
 
         # Use a default user_id since we removed auth
         default_user_id = "anonymous_user"
-        
-        for card in flashcards:
-            try:
-                emb = get_embedding(f"{card['question']} {card['answer']}")
-                save_flashcard(user_id=default_user_id, card=card, embedding=emb)
-            except Exception as e:
-                print(f"Error saving flashcard: {e}")
-                # Continue with other flashcards
-
-        return {"stored": len(flashcards), "flashcards": flashcards}
+
+        # Hold back until there is capacity for a document of this size, or refuse it
+        try:
+            cost = await run_in_threadpool(estimate_cost, path)
+            permit = await upload_admission.acquire(cost)
+        except Overloaded as e:
+            discard_upload(path)
+            log.warning("Upload rejected", extra={"reason": e.reason, "cost": round(cost, 2),
+                                                  "retry_after": e.retry_after})
+            raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+        except BaseException:
+            discard_upload(path)
+            raise
+
+        try:
+            job = job_manager.submit("upload-pdf", UPLOAD_STAGES, permit.bind(process_pdf), path, default_user_id,
+                                     n_cards, file.filename, digest)
+        except Exception:
+            permit.release()
+            discard_upload(path)
+            raise
+        return {"job_id": job.id, "status": job.status}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in upload_pdf: {e}")
+        log.exception("Unexpected error in upload_pdf")
+        ERRORS.inc(component="api.upload")
         raise HTTPException(500, f"Internal server error: {str(e)}")
 
-@app.get("/flashcards/")
-async def get_flashcards():
-    """Get all flashcards for the default user"""
+def _discard_all(spooled: list):
+    for path, _, _ in spooled:
+        discard_upload(path)
+
+@app.post("/upload-pdfs/", status_code=202)
+async def upload_pdfs(files: List[UploadFile] = File(...), n_cards: int = Form(5, ge=1, le=MAX_CARDS_PER_UPLOAD)):
+    """Accept several PDFs as one job that pipelines them; poll /jobs/{job_id} for per-file results"""
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(400, f"Upload at most {BATCH_MAX_FILES} files at once")
+    for file in files:
+        if file.content_type != "application/pdf":
+            raise HTTPException(400, f"Upload PDFs only: {file.filename}")
+    # Documents are tracked by name, so two files of one name would overwrite each other's manifest
+    names = [file.filename for file in files if file.filename]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise HTTPException(400, f"Duplicate file names: {', '.join(duplicates)}")
+
+    spooled = []
     try:
-        from db import get_flashcards
-        flashcards = get_flashcards("anonymous_user")
-        return {"flashcards": flashcards}
+        with STAGE_SECONDS.time(stage="spool"):
+            for file in files:
+                path, digest = await spool_upload(file)
+                spooled.append((path, file.filename, digest))
+
+        # The batch is admitted as a whole, at a cost capped well below capacity
+        cost = await run_in_threadpool(estimate_batch_cost, [path for path, _, _ in spooled])
+        permit = await upload_admission.acquire(cost)
+    except Overloaded as e:
+        _discard_all(spooled)
+        log.warning("Batch upload rejected", extra={"reason": e.reason, "files": len(files),
+                                                    "retry_after": e.retry_after})
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        _discard_all(spooled)
+        raise
     except Exception as e:
-        print(f"Error getting flashcards: {e}")
-        return {"flashcards": []}
+        _discard_all(spooled)
+        log.exception("Unexpected error in upload_pdfs")
+        ERRORS.inc(component="api.upload")
+        raise HTTPException(500, f"Internal server error: {str(e)}")
+    except BaseException:
+        # e.g. the client disconnecting while files spool or the batch waits for capacity
+        _discard_all(spooled)
+        raise
+
+    try:
+        job = job_manager.submit("upload-batch", BATCH_STAGES, permit.bind(process_pdf_batch), spooled,
+                                 "anonymous_user", n_cards)
+    except Exception:
+        permit.release()
+        _discard_all(spooled)
+        raise
+    return {"job_id": job.id, "status": job.status, "files": len(spooled)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get status, progress and result of a background job"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@app.get("/flashcards/")
+async def get_flashcards(limit: int = Query(None, ge=1, le=1000), cursor: str = None,
+                         fields: str = None, format: str = "json"):
+    """List flashcards for the default user.
+
+    Pass limit to page through the deck and cursor (the previous response's
+    next_cursor) for the next page. fields is a comma-separated projection;
+    embeddings are only returned when requested. format=ndjson streams the
+    whole deck one card per line.
+    """
+    from db import list_flashcards, iter_flashcards, decode_cursor, check_fields
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        field_list = check_fields([f.strip() for f in fields.split(",") if f.strip()] if fields else None)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if format == "ndjson":
+        # A page failing mid-stream aborts the response, so clients see an incomplete body, not a short deck
+        lines = (json.dumps(card) + "\n" for card in iter_flashcards("anonymous_user", field_list))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    try:
+        flashcards, next_cursor = await run_in_threadpool(
+            list_flashcards, "anonymous_user", field_list, limit, after
+        )
+        return {"flashcards": flashcards, "next_cursor": next_cursor}
+    except Exception:
+        log.exception("Error getting flashcards")
+        ERRORS.inc(component="api.flashcards")
+        return {"flashcards": [], "next_cursor": None}
 
 @app.post("/search-flashcards")
 async def search_flashcards(request: dict):
     """Search flashcards by query"""
     try:
-        from db import get_flashcards
-        query = request.get("query", "").lower()
+        from db import list_flashcards
+        query = request.get("query", "")
         limit = request.get("limit", 10)
-        
-        all_flashcards = get_flashcards("anonymous_user")
-        
-        # Simple text search
-        if query:
-            filtered = [
-                card for card in all_flashcards 
-                if query in card.get("question", "").lower() or 
-                   query in card.get("answer", "").lower()
-            ]
-        else:
-            filtered = all_flashcards
-            
-        return {"results": filtered[:limit]}
-    except Exception as e:
-        print(f"Error searching flashcards: {e}")
+
+        if not query.strip():
+            results, _ = await run_in_threadpool(list_flashcards, "anonymous_user", None, limit)
+            return {"results": results}
+
+        results = await run_in_threadpool(
+            search.search_flashcards, "anonymous_user", query, limit,
+            request.get("mode"), request.get("prefix", True), request.get("approximate"),
+        )
+        return {"results": results}
+    except Exception:
+        log.exception("Error searching flashcards")
+        ERRORS.inc(component="api.search")
         return {"results": []}
 
 @app.delete("/flashcards/{card_id}")
@@ -153,8 +266,9 @@ async def delete_flashcard(card_id: int):
         from db import delete_flashcard
         success = delete_flashcard(card_id, "anonymous_user")
         return {"success": success}
-    except Exception as e:
-        print(f"Error deleting flashcard: {e}")
+    except Exception:
+        log.exception("Error deleting flashcard")
+        ERRORS.inc(component="api.flashcards")
         return {"success": False}
 
 @app.put("/flashcards/{card_id}")
@@ -165,29 +279,18 @@ async def update_flashcard(card_id: int, updates: dict):
         updated_card = update_flashcard(card_id, "anonymous_user", updates)
         return updated_card or {"error": "Card not found"}
     except Exception as e:
-        print(f"Error updating flashcard: {e}")
+        log.exception("Error updating flashcard")
+        ERRORS.inc(component="api.flashcards")
         return {"error": str(e)}
 
 @app.get("/user/stats")
 async def get_user_stats():
     """Get user statistics"""
     try:
-        from db import get_flashcards
-        flashcards = get_flashcards("anonymous_user")
-        
-        total = len(flashcards)
-        easy = len([c for c in flashcards if c.get("difficulty") == "easy"])
-        medium = len([c for c in flashcards if c.get("difficulty") == "medium"])
-        hard = len([c for c in flashcards if c.get("difficulty") == "hard"])
-        
-        return {
-            "total_flashcards": total,
-            "easy_cards": easy,
-            "medium_cards": medium,
-            "hard_cards": hard
-        }
-    except Exception as e:
-        print(f"Error getting stats: {e}")
+        return await run_in_threadpool(stats_tracker.get, "anonymous_user")
+    except Exception:
+        log.exception("Error getting stats")
+        ERRORS.inc(component="api.stats")
         return {
             "total_flashcards": 0,
             "easy_cards": 0,
@@ -195,6 +298,49 @@ async def get_user_stats():
             "hard_cards": 0
         }
 
+@app.post("/user/stats/reconcile")
+async def reconcile_user_stats():
+    """Recount statistics from the store, repairing any drift"""
+    try:
+        drifted = await run_in_threadpool(stats_tracker.reconcile, "anonymous_user")
+        return {"drifted": drifted["anonymous_user"], "stats": stats_tracker.get("anonymous_user")}
+    except Exception as e:
+        log.exception("Error reconciling stats")
+        ERRORS.inc(component="api.stats")
+        return {"error": str(e)}
+
+@app.get("/health/providers")
+async def provider_health():
+    """State of the LLM and embedding providers"""
+    from hf_client import gemini_breaker
+    health = registry.health()
+    health["gemini"]["circuit"] = gemini_breaker.snapshot()
+    return health
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes of the in-process caches and indexes"""
+    from deck_cache import deck_cache
+    from hf_client import embedding_cache
+    from generation_cache import generation_cache
+    from vector_index import vector_index
+    return {
+        "decks": deck_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "generations": generation_cache.stats(),
+        "vectors": vector_index.stats(),
+    }
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """Upload capacity in use, queue depth and how many uploads waited, timed out or were refused"""
+    return upload_admission.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage timings, provider latencies, fallbacks and errors in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/protected")
 async def protected_route():
     """Protected route for testing (no auth required now)"""
@@ -0,0 +1,13 @@
+-- Per-document card tracking: source document names on flashcards and one
+-- manifest per (user, document) for incremental re-ingestion.
+-- Safe to run more than once.
+
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS document text;
+
+CREATE TABLE IF NOT EXISTS document_manifests (
+    user_id text NOT NULL,
+    document text NOT NULL,
+    manifest jsonb NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, document)
+);
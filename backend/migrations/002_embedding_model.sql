@@ -0,0 +1,6 @@
+-- Which model produced each card's embedding. Local fallback vectors have the
+-- same size as the remote model's but live in a different space, so search
+-- only compares vectors of one model. Untagged rows count as the remote model.
+-- Safe to run more than once.
+
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS embedding_model text;
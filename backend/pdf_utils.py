@@ -1,5 +1,76 @@
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import fitz
 
-def extract_text_from_pdf(path: str) -> str:
+# Documents with at least this many pages are extracted in parallel
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "150"))
+# Pages handed to each worker per task
+PAGES_PER_RANGE = int(os.getenv("PDF_PAGES_PER_RANGE", "50"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Workers are started fresh rather than forked from this multithreaded
+# process, where a fork can copy locks other threads hold
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=_MP_CONTEXT)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+def page_ranges(n_pages: int, pages_per_range: int = PAGES_PER_RANGE):
+    """Split [0, n_pages) into consecutive (start, stop) ranges"""
+    return [(start, min(start + pages_per_range, n_pages))
+            for start in range(0, n_pages, pages_per_range)]
+
+def _extract_range(path: str, start: int, stop: int) -> list:
+    # Runs in a worker process, which opens its own fitz handle
     with fitz.open(path) as doc:
-        return "".join(page.get_text() for page in doc)
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def page_fingerprint(text: str) -> str:
+    """Content hash of a page, insensitive to whitespace-only differences"""
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()[:32]
+
+def iter_pdf_pages(path: str):
+    """Yield the text of each page in order, holding one page at a time"""
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+def iter_pdf_pages_parallel(path: str, pages_per_range: int = PAGES_PER_RANGE):
+    """Yield page texts in order, extracting page ranges across the process pool"""
+    ranges = page_ranges(page_count(path), pages_per_range)
+    pool = _get_pool()
+    futures = [pool.submit(_extract_range, path, start, stop) for start, stop in ranges]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def extract_pages(path: str, parallel: bool = None):
+    """Yield page texts, going parallel once the document is large enough"""
+    if parallel is None:
+        parallel = PDF_WORKERS > 1 and page_count(path) >= PARALLEL_MIN_PAGES
+    if parallel:
+        return iter_pdf_pages_parallel(path)
+    return iter_pdf_pages(path)
+
+def extract_text_from_pdf(path: str, parallel: bool = None) -> str:
+    return "".join(extract_pages(path, parallel))
@@ -0,0 +1,297 @@
+import os
+import logging
+
+from ingest import discard_upload
+from pdf_utils import extract_pages, page_fingerprint
+from generation import iter_page_chunks, generate_flashcards_chunked
+from hf_client import GEMINI_API_KEY, HF_TOKEN, EMBEDDING_MODEL, embed_texts, generate_flashcards_with_provider
+from local_embeddings import LOCAL_EMBEDDING_MODEL
+from generation_cache import generation_cache, generation_key, MISS
+from db import save_flashcards, delete_flashcards, get_manifest, save_manifest
+from write_buffer import write_buffer
+from dedupe import near_duplicates, DEDUPE_ENABLED
+
+log = logging.getLogger(__name__)
+
+# Share of a manifest's pages an upload must contain to count as an edit of that document
+MANIFEST_MIN_OVERLAP = float(os.getenv("MANIFEST_MIN_OVERLAP", "0.5"))
+
+UPLOAD_STAGES = ["extract", "generate", "embed", "persist"]
+INCREMENTAL = "incremental"
+
+
+def _providers() -> tuple:
+    """The configured (generator, embedding model)"""
+    return "gemini" if GEMINI_API_KEY else "local", EMBEDDING_MODEL if HF_TOKEN else LOCAL_EMBEDDING_MODEL
+
+
+def generation_model() -> str:
+    """Identifies the providers whose output a cached generation depends on"""
+    return "|".join(_providers())
+
+
+def cacheable(generated: dict) -> bool:
+    """Whether the configured providers produced all of a generation, i.e. nothing fell back locally"""
+    generator, embedder = _providers()
+    return (generated.get("generator") == generator
+            and all(model == embedder for model in generated.get("embedding_models", [])))
+
+
+def chunk_pages(pages) -> list:
+    """(chunk, pages it came from) pairs for (page number, text) pairs"""
+    page_chunks = list(iter_page_chunks(pages))
+    if not page_chunks:
+        raise ValueError("Could not extract text")
+    return page_chunks
+
+
+def generate_cards(page_chunks: list, n_cards: int) -> dict:
+    """Generate cards from chunks, recording the pages behind each card.
+
+    "generator" names the provider behind every chunk, or is "mixed" when
+    some chunks fell back to the local rule engine or failed.
+    """
+    providers = []
+
+    def generator(text, per_chunk_cards):
+        try:
+            cards, provider = generate_flashcards_with_provider(text, per_chunk_cards)
+        except Exception:
+            providers.append(None)
+            raise
+        providers.append(provider)
+        return cards
+
+    chunks = [chunk for chunk, _ in page_chunks]
+    flashcards, sources = generate_flashcards_chunked(chunks, n_cards, generator=generator, return_sources=True)
+    if not flashcards:
+        raise ValueError("Flashcard generation failed")
+    return {
+        "chunks": chunks,
+        "flashcards": flashcards,
+        "card_pages": [page_chunks[source][1] for source in sources],
+        "generator": providers[0] if len(set(providers)) == 1 else "mixed",
+    }
+
+
+def card_texts(flashcards: list) -> list:
+    """The text each card is embedded from"""
+    return [f"{card['question']} {card['answer']}" for card in flashcards]
+
+
+def _generate_from_pages(job, pages, n_cards: int) -> dict:
+    """Chunk (page number, text) pairs, then generate and embed cards from them"""
+    page_chunks = chunk_pages(pages)
+
+    job.start_stage("generate")
+    generated = generate_cards(page_chunks, n_cards)
+
+    job.start_stage("embed")
+    generated["embeddings"], generated["embedding_models"] = embed_texts(card_texts(generated["flashcards"]))
+    return generated
+
+
+def _generate(job, path: str, n_cards: int) -> dict:
+    """Extract, generate and embed a whole document; the cacheable part of an upload"""
+    job.start_stage("extract")
+    fingerprints = []
+
+    def pages():
+        # Pages stream straight into the chunker, never joined into one string
+        for page_no, text in enumerate(extract_pages(path)):
+            fingerprints.append(page_fingerprint(text))
+            yield page_no, text
+
+    generated = _generate_from_pages(job, pages(), n_cards)
+    generated["fingerprints"] = fingerprints
+    return generated
+
+
+def diff_pages(path: str, manifest: dict):
+    """Compare a re-uploaded document with its manifest.
+
+    Pages are matched by fingerprint rather than position, so inserting or
+    removing a page does not invalidate the pages after it. Returns the new
+    fingerprints, the (page number, text) pairs that changed, the surviving
+    cards with their renumbered pages, and the ids of cards now stale. Only
+    the text of changed pages is kept in memory. Returns None when the
+    upload keeps less than MANIFEST_MIN_OVERLAP of the manifest's pages,
+    i.e. it is a different document that happens to share the name.
+    """
+    old_pages = {fp: page_no for page_no, fp in enumerate(manifest.get("pages", [])) if fp}
+    fingerprints, changed = [], []
+    for page_no, text in enumerate(extract_pages(path)):
+        fp = page_fingerprint(text)
+        fingerprints.append(fp)
+        if fp not in old_pages:
+            changed.append((page_no, text))
+    if not fingerprints:
+        raise ValueError("Could not extract text")
+
+    # Old page number -> new page number for every page that survived
+    moved = {old_pages[fp]: page_no for page_no, fp in enumerate(fingerprints) if fp in old_pages}
+    if not moved or len(moved) < MANIFEST_MIN_OVERLAP * len(old_pages):
+        return None
+    kept, stale = {}, []
+    for card_id, pages in manifest.get("cards", {}).items():
+        if all(page in moved for page in pages):
+            kept[card_id] = [moved[page] for page in pages]
+        else:
+            stale.append(card_id)
+    return {"fingerprints": fingerprints, "changed": changed, "kept": kept, "stale": stale}
+
+
+def change_budget(n_cards: int, changed_pages: int, total_pages: int) -> int:
+    """Spend the card budget in proportion to how much of the document changed"""
+    return max(1, round(n_cards * changed_pages / total_pages))
+
+
+def _regenerate(job, diff: dict, n_cards: int) -> dict:
+    """Re-ingest an edited document from its diff, generating cards only for pages that changed"""
+    changed = diff.pop("changed")
+
+    generated = {"flashcards": [], "embeddings": [], "embedding_models": [], "card_pages": []}
+    if changed:
+        budget = change_budget(n_cards, len(changed), len(diff["fingerprints"]))
+        generated = _generate_from_pages(job, changed, budget)
+
+    generated.update(diff, changed_pages=[page_no for page_no, _ in changed])
+    return generated
+
+
+def _persist(user_id: str, flashcards: list, embeddings: list, embedding_models: list):
+    """Save cards; returns (saved row or None for each card, per-row errors)"""
+    if write_buffer:
+        rows, errors = [], []
+        for i, future in enumerate(write_buffer.add_many(user_id, flashcards, embeddings, embedding_models)):
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append(None)
+                errors.append({"index": i, "error": str(e)})
+        return rows, errors
+
+    result = save_flashcards(user_id, flashcards, embeddings, embedding_models)
+    failed = {err["index"] for err in result["errors"]}
+    saved = iter(result["saved"])
+    rows = [None if i in failed else next(saved, None) for i in range(len(flashcards))]
+    return rows, result["errors"]
+
+
+def process_pdf(job, path: str, user_id: str, n_cards: int = 5, document: str = None, digest: str = None):
+    """Run extract -> generate -> embed -> persist for an uploaded PDF.
+
+    With the upload's SHA-256 digest, repeat uploads are served from the
+    generation cache and concurrent duplicates share one computation;
+    results that fell back to local providers are not cached. A
+    document that was ingested before under the same name only has its
+    changed pages regenerated; an unrelated PDF reusing the name is
+    ingested as new and leaves the earlier document's cards, and the
+    manifest that tracks them, alone. Cards
+    that nearly duplicate a stored card, or an earlier card of the same
+    upload, are dropped before saving.
+    """
+    try:
+        manifest = get_manifest(user_id, document) if document else None
+        diff, track = None, True
+        if manifest:
+            job.start_stage("extract")
+            diff = diff_pages(path, manifest)
+            if diff is None:
+                log.info("Upload does not match the stored document of the same name, ingesting it as new",
+                         extra={"user_id": user_id, "document": document})
+                # Keep the stored manifest while it still tracks cards
+                manifest, track = None, not manifest.get("cards")
+        if diff is not None:
+            generated, cache_outcome = _regenerate(job, diff, n_cards), INCREMENTAL
+        elif digest:
+            key = generation_key(digest, n_cards, generation_model())
+            generated, cache_outcome = generation_cache.get_or_compute(key, lambda: _generate(job, path, n_cards),
+                                                                      cacheable=cacheable)
+        else:
+            generated, cache_outcome = _generate(job, path, n_cards), MISS
+    finally:
+        discard_upload(path)
+
+    job.start_stage("persist")
+    return store_documents(user_id, [
+        {"document": document, "manifest": manifest, "generated": generated, "cache": cache_outcome,
+         "track": track},
+    ])[0]
+
+
+def store_documents(user_id: str, uploads: list) -> list:
+    """Save the generated cards of one or more documents in a single write.
+
+    Each upload is {"document", "manifest", "generated", "cache"}, plus
+    "track": False to leave the document's stored manifest as it is. Stale
+    cards of re-ingested documents are deleted first, so a rewording of a
+    replaced card is not dropped; near-duplicates are then filtered across
+    all the uploads together. Returns one result per upload.
+    """
+    stale = [int(card_id) for upload in uploads if upload["manifest"] for card_id in upload["generated"]["stale"]]
+    if stale:
+        delete_flashcards(stale, user_id)
+
+    flashcards, embeddings, models, card_pages, owners = [], [], [], [], []
+    for owner, upload in enumerate(uploads):
+        generated = upload["generated"]
+        if upload["document"]:
+            for card in generated["flashcards"]:
+                card["document"] = upload["document"]
+        flashcards += generated["flashcards"]
+        embeddings += generated["embeddings"]
+        models += generated.get("embedding_models") or [None] * len(generated["embeddings"])
+        card_pages += generated["card_pages"]
+        owners += [owner] * len(generated["flashcards"])
+
+    duplicates = []
+    if DEDUPE_ENABLED:
+        try:
+            keep, duplicates = near_duplicates.filter(user_id, flashcards)
+        except Exception:
+            # Without the stored deck there is nothing to compare against; save everything
+            log.warning("Near-duplicate check unavailable", extra={"user_id": user_id}, exc_info=True)
+            keep = range(len(flashcards))
+        duplicates = [owners[dup["index"]] for dup in duplicates]
+        flashcards = [flashcards[i] for i in keep]
+        embeddings = [embeddings[i] for i in keep]
+        models = [models[i] for i in keep]
+        card_pages = [card_pages[i] for i in keep]
+        owners = [owners[i] for i in keep]
+    rows, errors = _persist(user_id, flashcards, embeddings, models)
+
+    results = []
+    for owner, upload in enumerate(uploads):
+        mine = [i for i, card_owner in enumerate(owners) if card_owner == owner]
+        local = {i: n for n, i in enumerate(mine)}
+        own_rows = [rows[i] for i in mine]
+        generated, document = upload["generated"], upload["document"]
+
+        if document and upload.get("track", True):
+            cards, unsaved = dict(generated.get("kept", {})), set()
+            for row, i in zip(own_rows, mine):
+                if row and row.get("id") is not None:
+                    cards[str(row["id"])] = card_pages[i]
+                else:
+                    unsaved.update(card_pages[i])
+            # Pages behind cards that failed to save get no fingerprint, so the
+            # next upload of the document regenerates them instead of skipping them
+            pages = [None if page_no in unsaved else fp for page_no, fp in enumerate(generated["fingerprints"])]
+            save_manifest(user_id, document, {"pages": pages, "cards": cards})
+
+        result = {
+            "stored": sum(1 for row in own_rows if row is not None),
+            "failed": [{**err, "index": local[err["index"]]} for err in errors if err["index"] in local],
+            "flashcards": [flashcards[i] for i in mine],
+            "cache": upload["cache"],
+            "duplicates": duplicates.count(owner),
+        }
+        if upload["manifest"]:
+            result.update(
+                changed_pages=len(generated["changed_pages"]),
+                kept=len(generated["kept"]),
+                removed=len(generated["stale"]),
+            )
+        results.append(result)
+    return results
@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import threading
+
+GEMINI_MODEL_NAMES = ['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro', 'models/gemini-1.5-flash']
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Consecutive generation failures before the Gemini model is re-resolved
+PROVIDER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+
+READY = "ready"
+RESOLVING = "resolving"
+UNAVAILABLE = "unavailable"
+NOT_CONFIGURED = "not_configured"
+
+log = logging.getLogger(__name__)
+
+
+class ProviderRegistry:
+    """Warm, shared clients for Gemini and Hugging Face.
+
+    The working Gemini model is resolved once at startup instead of on every
+    request, and re-resolved in the background after repeated failures.
+    """
+
+    def __init__(self, gemini_api_key: str = None, hf_token: str = None):
+        self.gemini_api_key = gemini_api_key
+        self.hf_token = hf_token
+        self._gemini_model = None
+        self._embed_client = None
+        self._lock = threading.Lock()
+        self._resolving = False
+        self._pinned = False
+        self.gemini = {
+            "status": NOT_CONFIGURED if not gemini_api_key else UNAVAILABLE,
+            "model": None,
+            "resolved_at": None,
+            "consecutive_failures": 0,
+            "failures": 0,
+            "successes": 0,
+            "last_error": None,
+        }
+
+    def configure(self, gemini_api_key: str = None, hf_token: str = None):
+        self.gemini_api_key = gemini_api_key
+        self.hf_token = hf_token
+        self.gemini["status"] = NOT_CONFIGURED if not gemini_api_key else UNAVAILABLE
+
+    def start(self):
+        """Resolve the Gemini model and build the embedding client; run at startup"""
+        if self.gemini_api_key:
+            self.resolve_gemini()
+        if self.hf_token:
+            try:
+                self.embed_client()
+            except Exception as e:
+                log.warning("Hugging Face client init failed", extra={"error": str(e)})
+
+    def pin(self, gemini_model=None, embed_client=None):
+        """Use the given clients as-is and never re-resolve them; for tests and benchmarks"""
+        with self._lock:
+            self._pinned = True
+            self._gemini_model = gemini_model
+            self._embed_client = embed_client
+            self.gemini.update(
+                status=READY if gemini_model else NOT_CONFIGURED,
+                model=type(gemini_model).__name__ if gemini_model else None,
+                resolved_at=time.time(),
+                consecutive_failures=0,
+                last_error=None,
+            )
+
+    def resolve_gemini(self, probe: bool = True):
+        """Find the first Gemini model that works and keep it.
+
+        With probe, each candidate is checked with a cheap count_tokens call,
+        since constructing a GenerativeModel does not touch the network.
+        """
+        with self._lock:
+            if self._resolving:
+                return self._gemini_model
+            self._resolving = True
+            self.gemini["status"] = RESOLVING
+        model, model_name, last_error = None, None, None
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=self.gemini_api_key)
+            for name in GEMINI_MODEL_NAMES:
+                try:
+                    candidate = genai.GenerativeModel(name)
+                    if probe:
+                        candidate.count_tokens("ping")
+                    model, model_name = candidate, name
+                    break
+                except Exception as e:
+                    last_error = f"{name}: {e}"
+        except Exception as e:
+            last_error = str(e)
+
+        with self._lock:
+            self._resolving = False
+            self._gemini_model = model
+            self.gemini.update(
+                status=READY if model else UNAVAILABLE,
+                model=model_name,
+                resolved_at=time.time(),
+                consecutive_failures=0,
+                last_error=None if model else last_error,
+            )
+        if model:
+            log.info("Using Gemini model", extra={"model": model_name})
+        else:
+            log.warning("No valid Gemini model found", extra={"error": last_error})
+        return model
+
+    def gemini_model(self):
+        """The resolved Gemini model; resolves on first use if startup did not"""
+        model = self._gemini_model
+        if model is None and self.gemini_api_key and not self._resolving and not self._pinned:
+            model = self.resolve_gemini(probe=False)
+        if model is None:
+            raise RuntimeError("No valid Gemini model found")
+        return model
+
+    def report_success(self):
+        with self._lock:
+            self.gemini["consecutive_failures"] = 0
+            self.gemini["successes"] += 1
+
+    def report_failure(self, error: Exception):
+        with self._lock:
+            self.gemini["consecutive_failures"] += 1
+            self.gemini["failures"] += 1
+            self.gemini["last_error"] = str(error)
+            stale = (self.gemini["consecutive_failures"] >= PROVIDER_FAILURE_THRESHOLD
+                     and not self._resolving and not self._pinned)
+        if stale:
+            threading.Thread(target=self.resolve_gemini, name="gemini-resolve", daemon=True).start()
+
+    def embed_client(self):
+        """Shared Hugging Face inference client, created on first use"""
+        if self._embed_client is None:
+            with self._lock:
+                if self._embed_client is None:
+                    from huggingface_hub import InferenceClient
+                    self._embed_client = InferenceClient(model=EMBEDDING_MODEL, token=self.hf_token)
+        return self._embed_client
+
+    def health(self) -> dict:
+        with self._lock:
+            return {
+                "gemini": dict(self.gemini),
+                "huggingface": {
+                    "status": READY if self._embed_client else (UNAVAILABLE if self.hf_token else NOT_CONFIGURED),
+                    "model": EMBEDDING_MODEL,
+                },
+            }
+
+
+registry = ProviderRegistry()
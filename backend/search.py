@@ -0,0 +1,40 @@
+from hf_client import embed_texts
+from keyword_index import keyword_index
+from vector_index import vector_index
+
+# Reciprocal rank fusion constant; 60 is the usual choice
+RRF_K = 60
+MODES = ("keyword", "semantic", "hybrid")
+# Local n-gram embeddings stand in offline, so semantic ranking is always meaningful
+DEFAULT_MODE = "hybrid"
+
+
+def fuse(result_lists: list, k: int) -> list:
+    """Merge ranked result lists with reciprocal rank fusion"""
+    scores = {}
+    cards = {}
+    for results in result_lists:
+        for rank, card in enumerate(results):
+            scores[card["id"]] = scores.get(card["id"], 0.0) + 1.0 / (RRF_K + rank + 1)
+            cards.setdefault(card["id"], card)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [{**cards[card_id], "score": scores[card_id]} for card_id in ranked]
+
+
+def search_flashcards(user_id: str, query: str, limit: int = 10, mode: str = None,
+                      prefix: bool = True, approximate: bool = None) -> list:
+    """Rank a user's cards against query by BM25, embeddings, or both"""
+    mode = mode or DEFAULT_MODE
+    if mode not in MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    if mode == "keyword":
+        return keyword_index.search(user_id, query, limit, prefix)
+
+    vectors, models = embed_texts([query])
+    semantic = vector_index.search(user_id, vectors[0], limit * 2 if mode == "hybrid" else limit, approximate,
+                                   model=models[0])
+    if mode == "semantic":
+        return semantic
+    keyword = keyword_index.search(user_id, query, limit * 2, prefix)
+    return fuse([keyword, semantic], limit)
@@ -0,0 +1,210 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import embedding_codec
+from storage import StorageBackend, TABLE, MANIFEST_TABLE, COLUMNS
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "4"))
+# Seconds a writer waits on a locked database before giving up
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+# Embedding BLOB encoding: "int8" (per-vector scale), "float16", or "list" for raw float32
+SQLITE_EMBEDDING_FORMAT = os.getenv("SQLITE_EMBEDDING_FORMAT", "int8").lower()
+
+UPDATABLE = {"question", "answer", "difficulty", "document", "embedding", "embedding_model"}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    difficulty TEXT NOT NULL DEFAULT 'medium',
+    document TEXT,
+    embedding BLOB,
+    embedding_model TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_user_id ON {TABLE} (user_id, id);
+CREATE INDEX IF NOT EXISTS {TABLE}_user_created ON {TABLE} (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+    user_id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    manifest TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, document)
+);
+"""
+# Columns added after the first schema, added to older database files on open
+ADDED_COLUMNS = {"embedding_model": f"ALTER TABLE {TABLE} ADD COLUMN embedding_model TEXT"}
+
+# Fixed SQL text, so each pooled connection compiles a statement once and
+# reuses it from its statement cache afterwards
+INSERT_SQL = (f"INSERT INTO {TABLE} (user_id, question, answer, difficulty, document, embedding, embedding_model, "
+              f"created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING {', '.join(COLUMNS)}")
+SELECT_SQL = f"SELECT {{columns}} FROM {TABLE} WHERE user_id = ?"
+PAGE_SQL = f"SELECT {{columns}} FROM {TABLE} WHERE user_id = ? ORDER BY created_at, id LIMIT ?"
+PAGE_AFTER_SQL = (f"SELECT {{columns}} FROM {TABLE} WHERE user_id = ? "
+                  f"AND (created_at > ? OR (created_at = ? AND id > ?)) ORDER BY created_at, id LIMIT ?")
+UPDATE_SQL = f"UPDATE {TABLE} SET {{assignments}} WHERE id = ? AND user_id = ? RETURNING {', '.join(COLUMNS)}"
+DELETE_SQL = f"DELETE FROM {TABLE} WHERE user_id = ? AND id = ? RETURNING {', '.join(COLUMNS)}"
+GET_MANIFEST_SQL = f"SELECT manifest FROM {MANIFEST_TABLE} WHERE user_id = ? AND document = ?"
+SAVE_MANIFEST_SQL = (f"INSERT INTO {MANIFEST_TABLE} (user_id, document, manifest, updated_at) VALUES (?, ?, ?, ?) "
+                     f"ON CONFLICT (user_id, document) DO UPDATE SET manifest = excluded.manifest, "
+                     f"updated_at = excluded.updated_at")
+
+
+def pack_embedding(embedding):
+    """Encoded embeddings are stored as their raw bytes; lists as raw float32"""
+    if embedding is None:
+        return None
+    if embedding_codec.is_encoded_text(embedding):
+        return embedding_codec.from_text(embedding)
+    vec = embedding_codec.decode(embedding)
+    if SQLITE_EMBEDDING_FORMAT == "list":
+        return vec.tobytes()
+    return embedding_codec.encode(vec, SQLITE_EMBEDDING_FORMAT)
+
+
+def unpack_embedding(blob):
+    """A stored embedding as a list of floats, as the Supabase backend returns it.
+
+    Quantized blobs are decoded, so their values carry the quantization error.
+    """
+    if blob is None:
+        return None
+    return embedding_codec.decode(blob).tolist()
+
+
+def _columns(columns) -> list:
+    columns = list(columns or COLUMNS)
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+    return columns
+
+
+class SqliteBackend(StorageBackend):
+    """Flashcards in a local SQLite file, for single-node and offline deployments.
+
+    WAL mode lets readers proceed while a write is in progress. Connections
+    come from a fixed pool and are reused across threads, one thread at a
+    time. Embeddings are stored as BLOBs in the embedding_codec binary form.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = SQLITE_POOL_SIZE):
+        self.path = path
+        if path == ":memory:":
+            # Every connection to :memory: would get its own empty database
+            pool_size = 1
+        self._pool = queue.Queue()
+        self._connections = []
+        self._lock = threading.Lock()
+        for _ in range(max(1, pool_size)):
+            conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False,
+                                   isolation_level=None, cached_statements=64)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints rather than every commit; safe with WAL
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._connections.append(conn)
+            self._pool.put(conn)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            present = {row["name"] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+            for column, sql in ADDED_COLUMNS.items():
+                if column not in present:
+                    conn.execute(sql)
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        data = dict(row)
+        if "embedding" in data:
+            data["embedding"] = unpack_embedding(data["embedding"])
+        return data
+
+    def insert(self, rows: list) -> list:
+        params = [
+            (row["user_id"], row["question"], row["answer"], row.get("difficulty", "medium"),
+             row.get("document"), pack_embedding(row.get("embedding")), row.get("embedding_model"), row["created_at"])
+            for row in rows
+        ]
+        with self._transaction() as conn:
+            # fetchall() finishes each RETURNING statement before the commit
+            return [self._row(conn.execute(INSERT_SQL, values).fetchall()[0]) for values in params]
+
+    def select(self, user_id: str, columns: list = None) -> list:
+        sql = SELECT_SQL.format(columns=", ".join(_columns(columns)))
+        with self._connection() as conn:
+            return [self._row(row) for row in conn.execute(sql, (user_id,))]
+
+    def select_page(self, user_id: str, columns: list, limit: int = None, after: tuple = None) -> list:
+        columns = ", ".join(_columns(columns))
+        # LIMIT -1 is SQLite for no limit
+        limit = limit or -1
+        with self._connection() as conn:
+            if after:
+                created_at, card_id = after
+                rows = conn.execute(PAGE_AFTER_SQL.format(columns=columns),
+                                    (user_id, created_at, created_at, card_id, limit))
+            else:
+                rows = conn.execute(PAGE_SQL.format(columns=columns), (user_id, limit))
+            return [self._row(row) for row in rows]
+
+    def update(self, user_id: str, card_id: int, updates: dict) -> list:
+        unknown = set(updates) - UPDATABLE
+        if unknown:
+            raise ValueError(f"Cannot update columns: {sorted(unknown)}")
+        if not updates:
+            return []
+        names = sorted(updates)
+        values = [pack_embedding(updates[name]) if name == "embedding" else updates[name] for name in names]
+        sql = UPDATE_SQL.format(assignments=", ".join(f"{name} = ?" for name in names))
+        with self._transaction() as conn:
+            return [self._row(row) for row in conn.execute(sql, (*values, card_id, user_id)).fetchall()]
+
+    def delete(self, user_id: str, card_ids: list) -> list:
+        deleted = []
+        with self._transaction() as conn:
+            for card_id in card_ids:
+                deleted.extend(self._row(row) for row in conn.execute(DELETE_SQL, (user_id, card_id)).fetchall())
+        return deleted
+
+    def get_manifest(self, user_id: str, document: str):
+        with self._connection() as conn:
+            row = conn.execute(GET_MANIFEST_SQL, (user_id, document)).fetchone()
+        return json.loads(row["manifest"]) if row else None
+
+    def save_manifest(self, user_id: str, document: str, manifest: dict, updated_at: str):
+        with self._transaction() as conn:
+            conn.execute(SAVE_MANIFEST_SQL, (user_id, document, json.dumps(manifest), updated_at))
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
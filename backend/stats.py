@@ -0,0 +1,137 @@
+import os
+import logging
+import threading
+
+import db
+from lazy_index import LazyUserIndex
+
+log = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "900"))
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+class _UserStats:
+    def __init__(self):
+        self.cards = {}  # card id -> (difficulty, document), to undo a card's old counts
+        self.by_difficulty = {}
+        self.by_document = {}
+
+    def _count(self, difficulty, document, delta: int):
+        self.by_difficulty[difficulty] = self.by_difficulty.get(difficulty, 0) + delta
+        if document:
+            self.by_document[document] = self.by_document.get(document, 0) + delta
+            if not self.by_document[document]:
+                del self.by_document[document]
+
+    def upsert(self, row: dict):
+        old = self.cards.get(row["id"])
+        if old:
+            self._count(*old, -1)
+            difficulty = row.get("difficulty", old[0])
+            document = row.get("document", old[1])
+        else:
+            difficulty = row.get("difficulty", "medium")
+            document = row.get("document")
+        self.cards[row["id"]] = (difficulty, document)
+        self._count(difficulty, document, 1)
+
+    def remove(self, card_id):
+        old = self.cards.pop(card_id, None)
+        if old:
+            self._count(*old, -1)
+
+    def snapshot(self) -> dict:
+        return {
+            "total_flashcards": len(self.cards),
+            **{f"{level}_cards": self.by_difficulty.get(level, 0) for level in DIFFICULTIES},
+            "documents": dict(self.by_document),
+        }
+
+
+class StatsTracker(LazyUserIndex):
+    """Per-user card counters kept current from db write notifications.
+
+    Counters are built from the store the first time a user is asked for and
+    then only adjusted by deltas. reconcile() recounts from the store to repair
+    any drift, e.g. from writes made outside this process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reconciliations = 0
+        self.drift_repairs = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _build(self, rows: list) -> _UserStats:
+        stats = _UserStats()
+        self._apply(stats, "insert", rows)
+        return stats
+
+    def _apply(self, stats: _UserStats, event: str, rows: list):
+        for row in rows:
+            if row.get("id") is None:
+                continue
+            if event == "delete":
+                stats.remove(row["id"])
+            else:
+                stats.upsert(row)
+
+    def get(self, user_id: str) -> dict:
+        """The user's counters; raises when their deck cannot be fetched"""
+        stats = self._get(user_id)
+        with self._lock:
+            return stats.snapshot()
+
+    def reconcile(self, user_id: str = None) -> dict:
+        """Recount tracked users (or one user) from the store; returns {user_id: drifted}.
+
+        A user whose deck cannot be fetched keeps their current counters; a
+        single-user reconcile raises in that case, a full one skips them.
+        """
+        with self._lock:
+            user_ids = [user_id] if user_id else list(self.users)
+        drifted = {}
+        for uid in user_ids:
+            # Bypass the deck cache, which could carry the same drift
+            db.deck_cache.invalidate(uid)
+            with self._lock:
+                old = self.users.get(uid)
+            try:
+                fresh = self._refresh(uid)
+            except Exception:
+                if user_id:
+                    raise
+                log.warning("Stats reconciliation skipped", extra={"user_id": uid}, exc_info=True)
+                continue
+            with self._lock:
+                # Writes during the fetch reached both, so they compare like for like
+                drifted[uid] = old is not None and old.snapshot() != fresh.snapshot()
+                self.reconciliations += 1
+                self.drift_repairs += drifted[uid]
+        if any(drifted.values()):
+            log.info("Stats drift repaired", extra={"users": sum(drifted.values())})
+        return drifted
+
+    def start_reconciler(self, interval: float = STATS_RECONCILE_INTERVAL):
+        """Reconcile all tracked users every `interval` seconds in the background"""
+        if self._thread or interval <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reconcile()
+                except Exception:
+                    log.exception("Stats reconciliation failed")
+
+        self._thread = threading.Thread(target=run, name="stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop_reconciler(self):
+        self._stop.set()
+
+
+stats_tracker = StatsTracker()
+db.subscribe(stats_tracker.on_write)
@@ -0,0 +1,162 @@
+import os
+import logging
+
+from embedding_codec import to_storage
+
+log = logging.getLogger(__name__)
+
+# "supabase", "sqlite", or unset to use Supabase when its credentials are present
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "").lower()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "quickprep.db")
+# How Supabase embeddings are written: "list" of floats, as a pgvector column
+# requires, or "int8"/"float16" encoded text when the column is text
+EMBEDDING_FORMAT = os.getenv("EMBEDDING_FORMAT", "list").lower()
+
+TABLE = "flashcards"
+# One row per (user_id, document) holding its page fingerprints and card-to-page map
+MANIFEST_TABLE = "document_manifests"
+COLUMNS = ("id", "user_id", "question", "answer", "difficulty", "document", "embedding", "embedding_model",
+           "created_at")
+# Flashcards columns added by backend/migrations; left out of writes until they exist
+OPTIONAL_COLUMNS = ("document", "embedding_model")
+# Postgres undefined_column, and PostgREST's "column not in the schema cache"
+_MISSING_COLUMN_CODES = {"42703", "PGRST204"}
+
+
+class StorageBackend:
+    """Where flashcards and document manifests live.
+
+    db.py calls these and layers caching, write notifications and error
+    handling on top. Methods raise on failure; rows are plain dicts with
+    the flashcards columns, and writes return the affected rows.
+    """
+
+    name = None
+
+    def insert(self, rows: list) -> list:
+        """Insert rows in one operation, all or nothing; returns them with their ids"""
+        raise NotImplementedError
+
+    def select(self, user_id: str, columns: list = None) -> list:
+        """All of a user's cards, with `columns` only if given"""
+        raise NotImplementedError
+
+    def select_page(self, user_id: str, columns: list, limit: int = None, after: tuple = None) -> list:
+        """Cards in (created_at, id) order, strictly after the `after` key, at most `limit`"""
+        raise NotImplementedError
+
+    def update(self, user_id: str, card_id: int, updates: dict) -> list:
+        raise NotImplementedError
+
+    def delete(self, user_id: str, card_ids: list) -> list:
+        raise NotImplementedError
+
+    def get_manifest(self, user_id: str, document: str):
+        raise NotImplementedError
+
+    def save_manifest(self, user_id: str, document: str, manifest: dict, updated_at: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SupabaseBackend(StorageBackend):
+    """Postgres through the Supabase client; every call is a network round trip"""
+
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+        self._missing_columns = None
+
+    def missing_columns(self) -> set:
+        """OPTIONAL_COLUMNS the table lacks, probed once; other errors propagate and are retried"""
+        if self._missing_columns is None:
+            missing = set()
+            for column in OPTIONAL_COLUMNS:
+                try:
+                    self.client.table(TABLE).select(column).limit(1).execute()
+                except Exception as e:
+                    if str(getattr(e, "code", "")) not in _MISSING_COLUMN_CODES:
+                        raise
+                    missing.add(column)
+            if missing:
+                log.warning("Flashcards table predates backend/migrations, not storing these columns",
+                            extra={"columns": sorted(missing)})
+            self._missing_columns = missing
+        return self._missing_columns
+
+    def insert(self, rows: list) -> list:
+        missing = self.missing_columns()
+        if missing:
+            rows = [{key: value for key, value in row.items() if key not in missing} for row in rows]
+        if EMBEDDING_FORMAT != "list":
+            rows = [{**row, "embedding": to_storage(row.get("embedding"), EMBEDDING_FORMAT)} for row in rows]
+        return self.client.table(TABLE).insert(rows).execute().data or []
+
+    def select(self, user_id: str, columns: list = None) -> list:
+        query = self.client.table(TABLE).select(",".join(columns) if columns else "*")
+        return query.eq("user_id", user_id).execute().data or []
+
+    def select_page(self, user_id: str, columns: list, limit: int = None, after: tuple = None) -> list:
+        query = self.client.table(TABLE).select(",".join(columns)).eq("user_id", user_id)
+        if after:
+            created_at, card_id = after
+            query = query.or_(
+                f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{card_id})'
+            )
+        query = query.order("created_at").order("id")
+        if limit:
+            query = query.limit(limit)
+        return query.execute().data or []
+
+    def update(self, user_id: str, card_id: int, updates: dict) -> list:
+        if "embedding" in updates and EMBEDDING_FORMAT != "list":
+            updates = {**updates, "embedding": to_storage(updates["embedding"], EMBEDDING_FORMAT)}
+        return self.client.table(TABLE).update(updates).eq("id", card_id).eq("user_id", user_id).execute().data or []
+
+    def delete(self, user_id: str, card_ids: list) -> list:
+        query = self.client.table(TABLE).delete()
+        if len(card_ids) == 1:
+            query = query.eq("id", card_ids[0])
+        else:
+            query = query.in_("id", list(card_ids))
+        return query.eq("user_id", user_id).execute().data or []
+
+    def get_manifest(self, user_id: str, document: str):
+        result = (self.client.table(MANIFEST_TABLE).select("manifest")
+                  .eq("user_id", user_id).eq("document", document).execute())
+        return result.data[0]["manifest"] if result.data else None
+
+    def save_manifest(self, user_id: str, document: str, manifest: dict, updated_at: str):
+        self.client.table(MANIFEST_TABLE).upsert({
+            "user_id": user_id,
+            "document": document,
+            "manifest": manifest,
+            "updated_at": updated_at,
+        }, on_conflict="user_id,document").execute()
+
+
+def create_backend(kind: str = STORAGE_BACKEND):
+    """Build the configured backend; None when nothing is configured"""
+    try:
+        if kind == "sqlite":
+            from sqlite_store import SqliteBackend
+            backend = SqliteBackend(SQLITE_PATH)
+            log.info("SQLite storage initialized", extra={"path": SQLITE_PATH})
+            return backend
+        if kind in ("", "supabase"):
+            if SUPABASE_URL and SUPABASE_KEY:
+                from supabase import create_client
+                backend = SupabaseBackend(create_client(SUPABASE_URL, SUPABASE_KEY))
+                log.info("Supabase client initialized")
+                return backend
+            log.warning("Supabase credentials not found, flashcards will not be stored")
+            return None
+        log.error("Unknown storage backend", extra={"backend": kind})
+    except Exception:
+        log.exception("Storage backend initialization failed", extra={"backend": kind})
+    return None
@@ -0,0 +1,236 @@
+import os
+
+import numpy as np
+
+import db
+from lazy_index import LazyUserIndex
+from providers import EMBEDDING_MODEL
+from embedding_codec import DTYPES, decode, quantize
+
+# Decks at least this large are searched with the approximate IVF index
+VECTOR_IVF_MIN_SIZE = int(os.getenv("VECTOR_IVF_MIN_SIZE", "20000"))
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+VECTOR_IVF_ITERATIONS = 10
+# How vectors are held in memory: "int8", "float16" or "float32"
+VECTOR_INDEX_FORMAT = os.getenv("VECTOR_INDEX_FORMAT", "int8").lower()
+# Rows dequantized at a time while scoring, bounding the float32 scratch space
+SCORE_BLOCK_ROWS = 4096
+
+
+def parse_embedding(value):
+    """Stored embeddings in any format the codec reads, as a float32 vector"""
+    return decode(value)
+
+
+def _normalize(vec: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class _Matrix:
+    """Unit-normalized vectors of one dimension, kept quantized in a growable matrix.
+
+    Row i is approximately codes[i] * scales[i]; for float16 and float32 the
+    scales are all 1.
+    """
+
+    def __init__(self, dim: int, kind: str = VECTOR_INDEX_FORMAT):
+        self.dim = dim
+        self.kind = kind
+        self.codes = np.empty((16, dim), dtype=DTYPES[kind])
+        self.scales = np.empty(16, dtype=np.float32)
+        self.ids = []
+        self.rows = {}  # card id -> row in codes
+        # IVF state, trained lazily once the matrix is large enough
+        self.centroids = None
+        self.assignments = np.empty(16, dtype=np.int32)
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the stored vectors"""
+        n = len(self.ids)
+        return self.codes[:n].nbytes + self.scales[:n].nbytes
+
+    def set(self, card_id, vec: np.ndarray):
+        vec = _normalize(vec)
+        row = self.rows.get(card_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.codes):
+                self.codes = np.concatenate([self.codes, np.empty_like(self.codes)])
+                self.scales = np.concatenate([self.scales, np.empty_like(self.scales)])
+                self.assignments = np.concatenate([self.assignments, np.empty_like(self.assignments)])
+            self.ids.append(card_id)
+            self.rows[card_id] = row
+        self.codes[row], self.scales[row] = quantize(vec, self.kind)
+        if self.centroids is not None:
+            self.assignments[row] = int(np.argmax(self.centroids @ vec))
+
+    def remove(self, card_id):
+        row = self.rows.pop(card_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            # Move the last row into the hole so the matrix stays dense
+            moved = self.ids[last]
+            self.codes[row] = self.codes[last]
+            self.scales[row] = self.scales[last]
+            self.assignments[row] = self.assignments[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+
+    def vectors(self, rows) -> np.ndarray:
+        """Dequantized float32 copies of the given rows"""
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Dot products with query for the given rows (all rows by default).
+
+        Codes are widened to float32 a block at a time so the matrix product
+        still runs in BLAS without a full-size float32 copy of the deck.
+        """
+        n = len(self.ids) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, n)
+            block = self.codes[start:stop] if rows is None else self.codes[rows[start:stop]]
+            out[start:stop] = block.astype(np.float32, copy=False) @ query
+        return out * (self.scales[:n] if rows is None else self.scales[rows])
+
+    def train(self):
+        """k-means over the current vectors to build the IVF coarse quantizer"""
+        n = len(self.ids)
+        vectors = self.vectors(slice(0, n))
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(n, n_lists, replace=False)].copy()
+        for _ in range(VECTOR_IVF_ITERATIONS):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = vectors[assignments == c]
+                if len(members):
+                    centroids[c] = _normalize(members.mean(axis=0))
+        self.centroids = centroids
+        self.assignments[:n] = np.argmax(vectors @ centroids.T, axis=1)
+        self.trained_size = n
+
+    def search(self, query: np.ndarray, k: int, approximate: bool):
+        n = len(self.ids)
+        if n == 0:
+            return []
+        query = _normalize(query)
+        candidates = None
+        if approximate:
+            if self.centroids is None or n > 2 * self.trained_size:
+                self.train()
+            nprobe = min(VECTOR_IVF_NPROBE, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            candidates = np.flatnonzero(np.isin(self.assignments[:n], probes))
+        scores = self.scores(query, candidates)
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = candidates[top] if candidates is not None else top
+        return [(self.ids[row], float(scores[i])) for row, i in zip(rows, top)]
+
+
+def embedding_model(row: dict) -> str:
+    """The model a stored vector came from; untagged rows are taken to be from the remote model"""
+    return row.get("embedding_model") or EMBEDDING_MODEL
+
+
+class _UserVectors:
+    """One user's matrices, one per embedding model and dimension, and the cards they index"""
+
+    def __init__(self):
+        self.matrices = {}  # (model, dim) -> _Matrix
+        self.cards = {}  # card id -> card without its embedding
+
+    def upsert(self, rows: list):
+        for row in rows:
+            card_id = row.get("id")
+            if card_id is None:
+                continue
+            card = {key: value for key, value in row.items() if key != "embedding"}
+            self.cards[card_id] = {**self.cards.get(card_id, {}), **card}
+            vec = parse_embedding(row.get("embedding"))
+            if vec is None:
+                continue
+            key = (embedding_model(row), vec.size)
+            for other, matrix in self.matrices.items():
+                if other != key:
+                    matrix.remove(card_id)
+            matrix = self.matrices.setdefault(key, _Matrix(vec.size))
+            matrix.set(card_id, vec)
+
+    def remove(self, rows: list):
+        for row in rows:
+            self.cards.pop(row.get("id"), None)
+            for matrix in self.matrices.values():
+                matrix.remove(row.get("id"))
+
+
+class VectorIndex(LazyUserIndex):
+    """Per-user cosine similarity index over flashcard embeddings.
+
+    A user's deck is loaded from the database on first search and then kept
+    current from db write notifications, so queries never refetch the table.
+    Vectors are only compared with those of the same embedding model, since
+    the local fallback embeds into a different space of the same size.
+    """
+
+    def __init__(self, ivf_min_size: int = VECTOR_IVF_MIN_SIZE):
+        super().__init__()
+        self.ivf_min_size = ivf_min_size
+
+    def _build(self, rows: list) -> _UserVectors:
+        vectors = _UserVectors()
+        vectors.upsert(rows)
+        return vectors
+
+    def _apply(self, vectors: _UserVectors, event: str, rows: list):
+        if event == "delete":
+            vectors.remove(rows)
+        else:
+            vectors.upsert(rows)
+
+    def search(self, user_id: str, query_vec, k: int = 10, approximate: bool = None, model: str = EMBEDDING_MODEL):
+        """Return the k cards nearest to query_vec among those embedded by model, each with its cosine score"""
+        query = np.asarray(query_vec, dtype=np.float32).ravel()
+        vectors = self._get(user_id)
+        with self._lock:
+            matrix = vectors.matrices.get((model, query.size))
+            if matrix is None:
+                return []
+            if approximate is None:
+                approximate = len(matrix) >= self.ivf_min_size
+            hits = matrix.search(query, k, approximate)
+            return [{**vectors.cards[card_id], "score": score} for card_id, score in hits]
+
+    def size(self, user_id: str) -> int:
+        with self._lock:
+            vectors = self.users.get(user_id)
+            return sum(len(m) for m in vectors.matrices.values()) if vectors else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            matrices = [m for vectors in self.users.values() for m in vectors.matrices.values()]
+            return {
+                "users": len(self.users),
+                "vectors": sum(len(m) for m in matrices),
+                "bytes": sum(m.nbytes for m in matrices),
+                "format": VECTOR_INDEX_FORMAT,
+            }
+
+
+vector_index = VectorIndex()
+db.subscribe(vector_index.on_write)
@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+import db
+
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "200"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+
+
+class WriteBehindBuffer:
+    """Coalesces flashcard inserts from concurrent uploads into bulk writes.
+
+    Rows are flushed when max_rows are pending or interval seconds after the
+    first pending row, whichever comes first. Each add() returns a Future that
+    resolves to the saved row or raises the per-row insert error.
+    """
+
+    def __init__(self, insert_rows=None, max_rows: int = WRITE_BEHIND_MAX_ROWS,
+                 interval: float = WRITE_BEHIND_INTERVAL):
+        self.insert_rows = insert_rows or db.insert_rows
+        self.max_rows = max_rows
+        self.interval = interval
+        self.pending = []
+        self.flushes = 0
+        self._first_pending_at = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def add(self, user_id: str, card: dict, embedding: list, embedding_model: str = None) -> Future:
+        future = Future()
+        row = db.flashcard_row(user_id, card, embedding, embedding_model=embedding_model)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            self.pending.append((row, future))
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def add_many(self, user_id: str, cards: list, embeddings: list, embedding_models: list = None) -> list:
+        models = embedding_models or [None] * len(cards)
+        return [self.add(user_id, card, emb, model) for card, emb, model in zip(cards, embeddings, models)]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self.pending) >= self.max_rows:
+                        break
+                    if self._first_pending_at is not None:
+                        remaining = self._first_pending_at + self.interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed and not self.pending:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write out everything pending now"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self.pending = self.pending, []
+                self._first_pending_at = None
+            if not batch:
+                return
+
+            for start in range(0, len(batch), self.max_rows):
+                chunk = batch[start:start + self.max_rows]
+                try:
+                    saved, errors = self.insert_rows([row for row, _ in chunk])
+                except Exception as e:
+                    for _, future in chunk:
+                        future.set_exception(e)
+                    continue
+                self.flushes += 1
+
+                failed = {err["index"]: err["error"] for err in errors}
+                saved_rows = iter(saved)
+                for i, (row, future) in enumerate(chunk):
+                    if i in failed:
+                        future.set_exception(RuntimeError(failed[i]))
+                    else:
+                        future.set_result(next(saved_rows, row))
+
+    def close(self):
+        """Flush remaining rows and stop the background thread; call on shutdown"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+
+write_buffer = WriteBehindBuffer() if WRITE_BEHIND else None
@@ -91,12 +91,36 @@ const apiService = {
         timeout: 120000, // 2 minutes
       });
 
-      return response.data;
+      // Processing runs in the background; wait for the job to finish
+      return await this.waitForJob(response.data.job_id);
     } catch (error) {
       throw new Error(`PDF upload failed: ${error.message}`);
     }
   },
 
+  /**
+   * Poll a background job until it completes or fails
+   * @param {string} jobId - ID returned by the upload endpoint
+   * @param {number} interval - Delay between polls in milliseconds
+   * @param {number} timeout - Maximum time to wait in milliseconds
+   * @returns {Promise<Object>} Job result
+   */
+  async waitForJob(jobId, interval = 1000, timeout = 300000) {
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+      const response = await apiClient.get(`/jobs/${jobId}`);
+      const job = response.data;
+      if (job.status === 'completed') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed');
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+    throw new Error('Timed out waiting for flashcard generation');
+  },
+
   /**
    * Search flashcards using semantic search
    * @param {string} query - Search query